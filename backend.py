@@ -0,0 +1,388 @@
+"""
+Module for LP backends, the solvers under Model, Dual and Myerson
+A backend loads an LP in matrix form (see builder.py), modifies it in place and returns solution values
+as NumPy arrays, with Gurobi's status codes and sign conventions: Pi <= 0 on >= rows of a maximization,
+RC = c - A^T Pi, Slack = RHS - row activity, 0 when the row is at its bound, basis statuses VBasis and
+CBasis (0 basic, -1 at the lower bound, -2 at the upper bound, -3 free), and the right-hand side ranging
+SARHSLow, SARHSUp of the rows, over which the current basis stays optimal.
+Both backends also answer the few gp.Model methods used by the scripts and printer.py
+(optimize, status, objVal, getVars, getAttr, getVarByName, write, computeIIS).
+
+GurobiLP: Gurobi, through gurobipy
+HighsLP: HiGHS, through highspy, without a license
+
+Zejian Huang
+"""
+
+import time
+
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gp
+from gurobipy import GRB
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# simplex method of a re-optimization, None to let the solver choose
+METHODS = {None: -1, "primal": 0, "dual": 1}
+
+
+"""
+Create an empty LP of a backend
+:param backend: "gurobi" or "highs"
+:param name: name of the model
+:param env: Gurobi environment, ignored by HiGHS
+"""
+def make_lp(backend, name, env=None):
+    if backend == "gurobi":
+        return GurobiLP(name, env)
+    if backend == "highs":
+        return HighsLP(name)
+    raise ValueError("unknown LP backend: " + str(backend))
+
+
+class Value:
+    """
+    A solution value with the x attribute of a solved Gurobi variable
+    """
+    def __init__(self, x):
+        self.x = x
+
+
+class GurobiLP:
+    """
+    Gurobi model, any other gp.Model attribute or method is forwarded to the model
+    """
+    def __init__(self, name, env=None):
+        self.model = gp.Model(name, env=env)
+        self.model.Params.LogToConsole = 0
+        self.model.Params.DualReductions = 0
+        self.method = None  # default method of optimize, see set_params
+        self._vars = None
+        self._constrs = None
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+    """
+    Add variables
+    :param names: list of variable names
+    """
+    def add_vars(self, lb, ub, obj, names):
+        self.model.addMVar(len(names), vtype=GRB.CONTINUOUS, lb=lb, ub=ub, obj=obj, name=np.array(names))
+        self._vars = None
+
+    """
+    Add rows A x (sense) rhs over all variables
+    :param names: list of row names
+    """
+    def add_rows(self, A, sense, rhs, names):
+        self.model.addMConstr(A, None, sense, rhs, name=names)
+        self._constrs = None
+
+    def set_maximize(self, maximize=True):
+        self.model.ModelSense = GRB.MAXIMIZE if maximize else GRB.MINIMIZE
+
+    def variables(self):
+        if self._vars is None:
+            self.model.update()
+            self._vars = self.model.getVars()
+        return self._vars
+
+    def constraints(self):
+        if self._constrs is None:
+            self.model.update()
+            self._constrs = self.model.getConstrs()
+        return self._constrs
+
+    @property
+    def num_rows(self):
+        return len(self.constraints())
+
+    @property
+    def num_cols(self):
+        return len(self.variables())
+
+    def set_obj(self, cols, values):
+        variables = self.variables()
+        self.model.setAttr("Obj", [variables[c] for c in np.asarray(cols).tolist()], values)
+
+    def set_rhs(self, rows, values):
+        constrs = self.constraints()
+        self.model.setAttr("RHS", [constrs[r] for r in np.asarray(rows).tolist()], values)
+
+    """
+    Change the coefficients A[rows, cols] to values, one chgCoeff per coefficient
+    """
+    def set_coeffs(self, rows, cols, values):
+        variables = self.variables()
+        constrs = self.constraints()
+        for r, c, v in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist(), np.asarray(values).tolist()):
+            self.model.chgCoeff(constrs[r], variables[c], v)
+
+    """
+    Set solver parameters, by Gurobi's names (e.g. FeasibilityTol), and method, the default method of optimize
+    """
+    def set_params(self, params):
+        for name, value in params.items():
+            if name == "method":
+                self.method = value
+            else:
+                self.model.setParam(name, value)
+
+    """
+    Optimize from the current basis, if any
+    :param method: "primal" or "dual" simplex, None for the default method, by default to let Gurobi choose
+    """
+    def optimize(self, method=None):
+        self.model.Params.Method = METHODS[self.method if method is None else method]
+        self.model.optimize()
+
+    """
+    Values of an attribute of all variables (X, RC, Obj) or all constraints (Pi, Slack, RHS) as an array
+    """
+    def get(self, attr):
+        return np.array(self.model.getAttr(attr))
+
+    """
+    Statistics of the last optimization and the size of the model
+    """
+    def stats(self):
+        return {"runtime": self.model.Runtime, "iterations": self.model.IterCount, "rows": self.model.NumConstrs,
+                "cols": self.model.NumVars, "nnz": self.model.NumNZs}
+
+
+class HighsLP:
+    """
+    HiGHS model
+    """
+    def __init__(self, name):
+        if highspy is None:
+            raise ImportError("the HiGHS backend requires highspy")
+        self.name = name
+        self.h = highspy.Highs()
+        self.h.setOptionValue("output_flag", False)
+        self.col_names = []
+        self.row_names = []
+        self.lb = np.empty(0)
+        self.ub = np.empty(0)
+        self.sense = np.empty(0, dtype="<U1")
+        self.rhs = np.empty(0)
+        self.status = GRB.LOADED
+        self.ObjVal = np.nan
+        self.Runtime = 0.0
+        self.IterCount = 0
+        self.solution = None
+        self.basis = None
+        self.method = None  # default method of optimize, see set_params
+        self._index = None
+
+    """
+    Add variables
+    :param names: list of variable names
+    """
+    def add_vars(self, lb, ub, obj, names):
+        k = len(names)
+        lb = np.broadcast_to(np.asarray(lb, dtype=np.float64), (k,))
+        ub = np.broadcast_to(np.asarray(ub, dtype=np.float64), (k,))
+        self.h.addCols(k, np.broadcast_to(np.asarray(obj, dtype=np.float64), (k,)).copy(), lb.copy(), ub.copy(),
+                       0, np.zeros(k, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0))
+        self.lb = np.concatenate([self.lb, lb])
+        self.ub = np.concatenate([self.ub, ub])
+        self.col_names += list(names)
+        self._index = None
+
+    """
+    Add rows A x (sense) rhs over all variables
+    :param names: list of row names
+    """
+    def add_rows(self, A, sense, rhs, names):
+        A = sp.csr_matrix(A)
+        k = A.shape[0]
+        sense = np.broadcast_to(np.asarray(sense), (k,))
+        rhs = np.broadcast_to(np.asarray(rhs, dtype=np.float64), (k,))
+        lower, upper = self.bounds(sense, rhs)
+        self.h.addRows(k, lower, upper, A.nnz, A.indptr[:-1].astype(np.int32), A.indices.astype(np.int32),
+                       A.data.astype(np.float64))
+        self.sense = np.concatenate([self.sense, sense])
+        self.rhs = np.concatenate([self.rhs, rhs])
+        self.row_names += list(names)
+
+    """
+    Row bounds of rows with the given senses and right-hand sides
+    """
+    def bounds(self, sense, rhs):
+        lower = np.where(sense == GRB.LESS_EQUAL, -highspy.kHighsInf, rhs)
+        upper = np.where(sense == GRB.GREATER_EQUAL, highspy.kHighsInf, rhs)
+        return lower, upper
+
+    def set_maximize(self, maximize=True):
+        self.h.changeObjectiveSense(highspy.ObjSense.kMaximize if maximize else highspy.ObjSense.kMinimize)
+
+    @property
+    def num_rows(self):
+        return len(self.rhs)
+
+    @property
+    def num_cols(self):
+        return len(self.col_names)
+
+    def set_obj(self, cols, values):
+        cols = np.asarray(cols, dtype=np.int32)
+        self.h.changeColsCost(len(cols), cols, np.asarray(values, dtype=np.float64))
+
+    def set_rhs(self, rows, values):
+        rows = np.asarray(rows, dtype=np.int32)
+        self.rhs[rows] = values
+        lower, upper = self.bounds(self.sense[rows], self.rhs[rows])
+        self.h.changeRowsBounds(len(rows), rows, lower, upper)
+
+    """
+    Change the coefficients A[rows, cols] to values, one changeCoeff per coefficient
+    """
+    def set_coeffs(self, rows, cols, values):
+        for r, c, v in zip(np.asarray(rows).tolist(), np.asarray(cols).tolist(), np.asarray(values).tolist()):
+            self.h.changeCoeff(r, c, v)
+
+    """
+    Set solver parameters, by HiGHS's option names (e.g. primal_feasibility_tolerance), and method, the default
+    method of optimize
+    """
+    def set_params(self, params):
+        for name, value in params.items():
+            if name == "method":
+                self.method = value
+            else:
+                self.h.setOptionValue(name, value)
+
+    """
+    Optimize from the current basis, if any
+    :param method: "primal" or "dual" simplex, None for the default method, by default to let HiGHS choose
+    """
+    def optimize(self, method=None):
+        if method is None:
+            method = self.method
+        if method is None:
+            self.h.setOptionValue("solver", "choose")
+        else:
+            self.h.setOptionValue("solver", "simplex")
+            self.h.setOptionValue("simplex_strategy", 4 if method == "primal" else 1)
+        start = time.perf_counter()
+        self.h.run()
+        self.Runtime = time.perf_counter() - start
+        info = self.h.getInfo()
+        self.IterCount = info.simplex_iteration_count + max(info.ipm_iteration_count, 0)
+        status = self.h.getModelStatus()
+        self.status = {
+            highspy.HighsModelStatus.kOptimal: GRB.OPTIMAL,
+            highspy.HighsModelStatus.kInfeasible: GRB.INFEASIBLE,
+            highspy.HighsModelStatus.kUnboundedOrInfeasible: GRB.INF_OR_UNBD,
+            highspy.HighsModelStatus.kUnbounded: GRB.UNBOUNDED,
+            highspy.HighsModelStatus.kTimeLimit: GRB.TIME_LIMIT,
+            highspy.HighsModelStatus.kIterationLimit: GRB.ITERATION_LIMIT,
+        }.get(status, GRB.NUMERIC)
+        self.ObjVal = info.objective_function_value
+        self.solution = self.h.getSolution()
+        self.basis = self.h.getBasis()
+
+    """
+    Values of an attribute of all variables (X, RC, Obj, VBasis) or all constraints (Pi, Slack, RHS, CBasis,
+    SARHSLow, SARHSUp) as an array
+    """
+    def get(self, attr):
+        attr = attr.lower()
+        if attr == "x":
+            # HiGHS may return values slightly outside the bounds, within its feasibility tolerance
+            return np.clip(self.solution.col_value, self.lb, self.ub)
+        if attr == "rc":
+            return np.array(self.solution.col_dual)
+        if attr == "pi":
+            return np.array(self.solution.row_dual)
+        if attr == "slack":
+            basic = np.array([s == highspy.HighsBasisStatus.kBasic for s in self.basis.row_status], dtype=bool)
+            return np.where(basic, self.rhs - np.array(self.solution.row_value), 0.0)
+        if attr == "rhs":
+            return self.rhs.copy()
+        if attr == "obj":
+            return np.array(self.h.getLp().col_cost_)
+        if attr == "vbasis":
+            return basis_codes(self.basis.col_status)
+        if attr == "cbasis":
+            return basis_codes(self.basis.row_status)
+        if attr in ("sarhslow", "sarhsup"):
+            status, ranging = self.h.getRanging()
+            if status != highspy.HighsStatus.kOk:
+                raise RuntimeError("HiGHS ranging failed: " + str(status))
+            bound = ranging.row_bound_dn if attr == "sarhslow" else ranging.row_bound_up
+            values = np.array(bound.value_)
+            # a basic row stays basic until the right-hand side reaches its activity, on one side only, as in Gurobi
+            basic = basis_codes(self.basis.row_status) == 0
+            activity = np.array(self.solution.row_value)
+            if attr == "sarhslow":
+                limit = np.where(self.sense == GRB.LESS_EQUAL, activity, -np.inf)
+            else:
+                limit = np.where(self.sense == GRB.GREATER_EQUAL, activity, np.inf)
+            return np.where(basic & (self.sense != GRB.EQUAL), limit, values)
+        raise AttributeError("HighsLP has no attribute " + attr)
+
+    """
+    Statistics of the last optimization and the size of the model
+    """
+    def stats(self):
+        return {"runtime": self.Runtime, "iterations": self.IterCount, "rows": self.h.getNumRow(),
+                "cols": self.h.getNumCol(), "nnz": self.h.getNumNz()}
+
+    """
+    gp.Model methods used by the scripts and printer.py
+    """
+    @property
+    def objVal(self):
+        return self.ObjVal
+
+    def getVars(self):
+        return [Value(x) for x in self.get("X")]
+
+    def getAttr(self, attr, objs=None):
+        return self.get(attr).tolist()
+
+    def getVarByName(self, name):
+        if self._index is None:
+            self._index = {v: k for k, v in enumerate(self.col_names)}
+        return Value(self.get("X")[self._index[name]])
+
+    """
+    Write the model, with LP-safe names: HiGHS drops names with brackets or commas, so x[0] is written x_0
+    and IC[1,2] is written IC_1_2
+    """
+    def write(self, path):
+        for k, name in enumerate(self.col_names):
+            self.h.passColName(k, lp_name(name))
+        for k, name in enumerate(self.row_names):
+            self.h.passRowName(k, lp_name(name))
+        self.h.writeModel(path)
+
+    """
+    Irreducible infeasible subsystems are not available with HiGHS; raise, so that no plain model is written
+    as an .ilp file that looks like an IIS
+    """
+    def computeIIS(self):
+        raise NotImplementedError("IIS is not supported by the HiGHS backend, use the Gurobi backend to compute one")
+
+
+"""
+Name without the brackets and commas of indices, e.g. IC_1_2 for IC[1,2]
+"""
+def lp_name(name):
+    return name.replace("[", "_").replace(",", "_").replace("]", "")
+
+
+"""
+Gurobi's codes of HiGHS basis statuses
+"""
+def basis_codes(status):
+    codes = {highspy.HighsBasisStatus.kBasic: 0, highspy.HighsBasisStatus.kLower: -1,
+             highspy.HighsBasisStatus.kUpper: -2, highspy.HighsBasisStatus.kZero: -3}
+    return np.array([codes.get(s, -1) for s in status], dtype=int)
@@ -0,0 +1,291 @@
+"""
+Benchmark suite: time and memory of each stage across the number of types, generators and LP backends
+Stages: population generators (with an empty and a warm generator cache), calculate_*, construction of
+Model / Dual / Myerson (and the lazy Model), optimize, the closed form Myerson solver and print_solution.
+Each stage is timed on fresh inputs (best of repeat runs), then run once more under tracemalloc for the peak
+memory allocated in Python (NumPy included, the solvers' own memory excluded). The report is written as JSON,
+and a report of another commit can be compared stage by stage. Stages with all IC constraints grow as n ** 2;
+above their cap (max_model_n, max_print_n, max_lazy_n, also given on the command line) they are recorded as
+skipped rather than run, e.g. python benchmark.py --ns 9 1000 --backends highs --max-model-n none.
+
+Zejian Huang
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import gurobipy as gp
+import numpy as np
+from prettytable import PrettyTable
+
+import population
+from population import Population
+from model import Model
+from dual import Dual
+from myerson import Myerson, closed_form
+from printer import print_solution
+
+# parameters
+LAMBDA = 3  # social value for revenue
+q = 0.7  # ex ante constraint
+ns = [9, 50, 200, 1000, 5000]  # numbers of types
+generators = ["uniform", "exponential", "kumaraswamy", "random"]
+backends = ["highs", "gurobi"]
+max_model_n = 1000  # largest n of the stages with all IC constraints (n * (n-1) rows), None for all ns
+max_lazy_n = 1000  # largest n of the lazy Model, None for all ns
+max_print_n = 1000  # largest n of print_solution, None for all ns
+repeat = 3  # timed runs per stage
+report_path = "benchmark.json"
+baseline_path = None  # report of another commit to compare with, None for none
+
+
+"""
+Population generators, each setting the values and the type distribution of a population
+"""
+def gen_uniform(pop):
+    pop.vsList = pop.value_uniform(1, 5)
+    pop.vmList = pop.value_uniform(2, 3)
+    pop.vtList = pop.value_uniform(4, 2)
+    pop.type_uniform()
+
+
+def gen_exponential(pop):
+    pop.vsList = pop.value_exponential(scale=1)
+    pop.vmList = pop.value_uniform(2, 3)
+    pop.vtList = pop.value_uniform(4, 2)
+    pop.type_uniform()
+
+
+def gen_kumaraswamy(pop):
+    pop.vsList = pop.value_kumaraswamy(1.75, 10, 8, 5, 0.75)
+    pop.vmList = pop.value_uniform(2, 3)
+    pop.vtList = pop.value_uniform(4, 2)
+    pop.type_kumaraswamy(1.75, 10, 8, 5, 0.75)
+
+
+def gen_random(pop):
+    pop.vsList = pop.draw_uniform(1, 5, precision=4)
+    pop.vmList = pop.draw_uniform(2, 3, precision=4)
+    pop.vtList = pop.draw_uniform(2, 4, precision=4)[::-1]
+    pop.perturbation(-1e-3, 1e-3)
+    pop.type_uniform()
+
+
+GENERATORS = {"uniform": gen_uniform, "exponential": gen_exponential, "kumaraswamy": gen_kumaraswamy,
+              "random": gen_random}
+
+
+def calculate(pop):
+    pop.calculate_ratio()
+    pop.calculate_virtual_s()
+    pop.calculate_virtual_sm()
+    pop.calculate_virtual_st()
+    pop.calculate_hazard_rate()
+    pop.calculate_rec_hr_st()
+    pop.calculate_ironed_s()
+
+
+"""
+Population of a generator with all derived values
+"""
+def make_population(n, generator):
+    pop = Population(n, seed=0)
+    GENERATORS[generator](pop)
+    calculate(pop)
+    return pop
+
+
+"""
+New population with an empty generator cache, or a warm one if the generator ran once
+"""
+def new_population(n, generator=None):
+    population.tables.clear()
+    if generator is not None:
+        GENERATORS[generator](Population(n, seed=0))
+    return Population(n, seed=0)
+
+
+def solved(model):
+    model.optimize()
+    return model
+
+
+"""
+Solve a Model, Dual or Myerson and return its (primal) LP
+"""
+def optimize(model):
+    if isinstance(model, Dual):
+        model.m.optimize()
+        return model.m
+    model.optimize()
+    if isinstance(model, Myerson):
+        return model.primal
+    return model.m
+
+
+"""
+Stages of a population and backend, as (name, setup, run, max n); run is timed on the output of setup
+"""
+def stages(generator, backend):
+    def population(n):
+        return make_population(n, generator)
+    return [
+        ("generate", new_population, GENERATORS[generator], None),
+        ("generate cached", lambda n: new_population(n, generator), GENERATORS[generator], None),
+        ("calculate", population, calculate, None),
+        ("Model", population, lambda pop: Model(pop, q, LAMBDA, backend=backend), max_model_n),
+        ("Model.optimize", lambda n: Model(population(n), q, LAMBDA, backend=backend), optimize, max_model_n),
+        ("Model lazy", population, lambda pop: Model(pop, q, LAMBDA, lazy_ic=True, backend=backend), max_lazy_n),
+        ("Model lazy.optimize", lambda n: Model(population(n), q, LAMBDA, lazy_ic=True, backend=backend),
+         optimize, max_lazy_n),
+        ("Dual", population, lambda pop: Dual(pop, q, LAMBDA, backend=backend), max_model_n),
+        ("Dual.optimize", lambda n: Dual(population(n), q, LAMBDA, backend=backend), optimize, max_model_n),
+        ("Myerson", population, lambda pop: Myerson(pop, q, LAMBDA, backend=backend), max_model_n),
+        ("Myerson.optimize", lambda n: Myerson(population(n), q, LAMBDA, backend=backend), optimize, max_model_n),
+        ("print_solution", lambda n: solved(Model(population(n), q, LAMBDA, backend=backend)),
+         lambda model: print_solution(model.solution(), model.pop, q, 4), max_print_n),
+    ]
+
+
+"""
+Stages independent of the backend
+"""
+def common_stages(generator):
+    return [stage for stage in stages(generator, None)
+            if stage[0] in ("generate", "generate cached", "calculate")] + [
+        ("closed_form", lambda n: make_population(n, generator), lambda pop: closed_form(pop, q, LAMBDA), None)]
+
+
+"""
+Best time of repeat runs and peak Python memory of one more run of a stage
+:return: seconds, bytes, output of the last run
+"""
+def measure(setup, run, n):
+    times = []
+    for _ in range(repeat):
+        state = setup(n)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(state)
+            times.append(time.perf_counter() - start)
+    state = setup(n)
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        output = run(state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak, output
+
+
+"""
+Measure all stages
+:return: list of results {stage, generator, backend, n, seconds, peak_bytes}, with the objective value obj
+    of the solved stages, or {stage, generator, backend, n, error}, or {stage, generator, backend, n, skipped}
+    above the cap of the stage
+"""
+def run_all():
+    results = []
+    for generator in generators:
+        plan = [(None, stage) for stage in common_stages(generator)]
+        plan += [(backend, stage) for backend in backends for stage in stages(generator, backend)
+                 if stage[0] not in ("generate", "generate cached", "calculate")]
+        for backend, (name, setup, run, max_n) in plan:
+            for n in ns:
+                result = {"stage": name, "generator": generator, "backend": backend, "n": n}
+                if max_n is not None and n > max_n:
+                    result["skipped"] = "too large"
+                    print(result)
+                    results.append(result)
+                    continue
+                try:
+                    result["seconds"], result["peak_bytes"], output = measure(setup, run, n)
+                except gp.GurobiError as e:
+                    # e.g. the size limit of a restricted license
+                    result["error"] = "Gurobi error " + str(e.errno)
+                except ValueError as e:
+                    # e.g. closed_form with equal values
+                    result["error"] = str(e)
+                else:
+                    if name.endswith("optimize") or name == "closed_form":
+                        result["obj"] = output.objVal
+                print(result)
+                results.append(result)
+    return results
+
+
+"""
+Description of the run: commit, versions and parameters
+"""
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"commit": commit, "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine(), "ns": ns, "generators": generators,
+            "backends": backends, "repeat": repeat, "q": q, "LAMBDA": LAMBDA, "max_model_n": max_model_n,
+            "max_lazy_n": max_lazy_n, "max_print_n": max_print_n}
+
+
+"""
+Print the ratio of the times and peaks of a report to those of a baseline, for the stages in both
+"""
+def compare(report, baseline):
+    key = lambda r: (r["stage"], r["generator"], r["backend"] or "", r["n"])
+    old = {key(r): r for r in baseline["results"] if "seconds" in r}
+    t = PrettyTable(["stage", "generator", "backend", "n", "seconds", "old seconds", "ratio", "peak ratio"])
+    for r in report["results"]:
+        if "seconds" not in r or key(r) not in old:
+            continue
+        o = old[key(r)]
+        t.add_row([r["stage"], r["generator"], r["backend"], r["n"], "%.4g" % r["seconds"], "%.4g" % o["seconds"],
+                   "%.2f" % (r["seconds"] / o["seconds"]), "%.2f" % (r["peak_bytes"] / max(o["peak_bytes"], 1))])
+    print("baseline: " + str(baseline["metadata"]["commit"]))
+    print(t)
+
+
+"""
+A cap of n from the command line, none for no cap
+"""
+def cap(text):
+    return None if text.lower() == "none" else int(text)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time and memory of each stage")
+    parser.add_argument("--ns", type=int, nargs="+", default=ns, help="numbers of types")
+    parser.add_argument("--generators", nargs="+", choices=list(GENERATORS), default=generators)
+    parser.add_argument("--backends", nargs="+", choices=["highs", "gurobi"], default=backends)
+    parser.add_argument("--repeat", type=int, default=repeat, help="timed runs per stage")
+    parser.add_argument("--max-model-n", type=cap, default=max_model_n, help="largest n with all IC, or none")
+    parser.add_argument("--max-lazy-n", type=cap, default=max_lazy_n, help="largest n of the lazy Model, or none")
+    parser.add_argument("--max-print-n", type=cap, default=max_print_n, help="largest n of print_solution, or none")
+    parser.add_argument("--report", default=report_path, help="JSON report")
+    parser.add_argument("--baseline", default=baseline_path, help="report of another commit to compare with")
+    args = parser.parse_args()
+    ns, generators, backends, repeat = args.ns, args.generators, args.backends, args.repeat
+    max_model_n, max_lazy_n, max_print_n = args.max_model_n, args.max_lazy_n, args.max_print_n
+    report_path, baseline_path = args.report, args.baseline
+
+    report = {"metadata": metadata(), "results": run_all()}
+    with open(report_path, "w") as file:
+        json.dump(report, file, indent=1)
+
+    t = PrettyTable(["stage", "generator", "backend", "n", "seconds", "peak MB", "obj"])
+    for r in report["results"]:
+        if "seconds" in r:
+            t.add_row([r["stage"], r["generator"], r["backend"], r["n"], "%.4g" % r["seconds"],
+                       "%.3f" % (r["peak_bytes"] / 2 ** 20), r.get("obj", "")])
+        else:
+            t.add_row([r["stage"], r["generator"], r["backend"], r["n"], r.get("error", r.get("skipped")), "-", ""])
+    print(t)
+
+    if baseline_path is not None:
+        with open(baseline_path) as file:
+            compare(report, json.load(file))
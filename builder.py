@@ -0,0 +1,178 @@
+"""
+Module for assembling the LP models in matrix form
+The constraint matrices are built as SciPy sparse matrices directly from the population arrays,
+to be loaded through the matrix API (addMVar / addMConstr) instead of one LinExpr per constraint.
+
+Variables are ordered x, p, w (x, p in the Myerson environment) and constraints
+IC[i,j] (i != j, row-major), IR[i], supply (then bound[i] in the Myerson environment),
+the same order as the expression-built models and printer.print_solution.
+
+Zejian Huang
+"""
+
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+
+"""
+All ordered pairs (i, j) with i != j, in row-major order
+:return: arrays I, J of length n * (n-1)
+"""
+def ic_pairs(n):
+    I = np.repeat(np.arange(n), n - 1)
+    J = np.tile(np.arange(n - 1), n)
+    J += J >= I  # skip the diagonal
+    return I, J
+
+
+"""
+Local pairs (i, j), i.e. i and j adjacent in the given order, in both directions, in row-major order
+:param order: order of types, e.g. from Population.single_crossing
+"""
+def local_pairs(order):
+    I = np.concatenate([order[:-1], order[1:]])
+    J = np.concatenate([order[1:], order[:-1]])
+    rows = np.lexsort((J, I))
+    return I[rows], J[rows]
+
+
+"""
+Names "prefix[i,j]" for a list of pairs
+"""
+def pair_names(prefix, I, J):
+    return [prefix + "[" + str(i) + "," + str(j) + "]" for i, j in zip(I.tolist(), J.tolist())]
+
+
+"""
+Names "prefix[i]" for i in range(n)
+"""
+def index_names(prefix, n):
+    return [prefix + "[" + str(i) + "]" for i in range(n)]
+
+
+"""
+Coefficients of the utility of each type, one array per variable block
+u_i(k) = vs_i * x_k - vm_i * p_k - vt_i * w_k, or vs_i * x_k - p_k in the Myerson environment
+"""
+def utility_coefficients(pop, myerson=False):
+    if myerson:
+        return [pop.vs, -np.ones(pop.num_type)]
+    return [pop.vs, -pop.vm, -pop.vt]
+
+
+"""
+IC rows u_i(i) - u_i(j) >= 0 for the given pairs (i, j)
+:param coef: utility coefficients, see utility_coefficients
+"""
+def ic_matrix(coef, I, J):
+    n = len(coef[0])
+    rows = np.arange(len(I))
+    data = []
+    cols = []
+    for block, a in enumerate(coef):
+        data += [a[I], -a[I]]
+        cols += [block * n + I, block * n + J]
+    return sp.csr_matrix((np.concatenate(data), (np.tile(rows, 2 * len(coef)), np.concatenate(cols))),
+                         shape=(len(I), len(coef) * n))
+
+
+"""
+IR rows u_i(i) >= 0
+"""
+def ir_matrix(coef):
+    return sp.hstack([sp.diags(a) for a in coef], format="csr")
+
+
+"""
+Objective of the primal LP: (u_i(i) + LAMBDA * p_i) * f_i
+"""
+def primal_objective(pop, LAMBDA, myerson=False):
+    n = pop.num_type
+    coef = utility_coefficients(pop, myerson)
+    obj = np.concatenate(coef) * np.tile(pop.pdf, len(coef))
+    obj[n:2 * n] += LAMBDA * pop.pdf
+    return obj
+
+
+"""
+Build the primal LP in matrix form
+:param pop: a population instance
+:param q: ex ante constraint
+:param LAMBDA: social value for revenue
+:param myerson: build the single parameter model of myerson.Myerson
+:param pairs: IC pairs (I, J) to include, all pairs by default
+:return: objective, constraint matrix, senses, right-hand sides
+"""
+def primal_matrices(pop, q, LAMBDA, myerson=False, pairs=None):
+    n = pop.num_type
+    coef = utility_coefficients(pop, myerson)
+    I, J = ic_pairs(n) if pairs is None else pairs
+    obj = primal_objective(pop, LAMBDA, myerson)
+
+    supply = sp.csr_matrix((pop.pdf, (np.zeros(n, dtype=int), np.arange(n))), shape=(1, len(coef) * n))
+    blocks = [ic_matrix(coef, I, J), ir_matrix(coef), supply]
+    sense = [np.full(len(I) + n, GRB.GREATER_EQUAL), [GRB.LESS_EQUAL]]
+    rhs = [np.zeros(len(I) + n), [q]]
+    if myerson:
+        blocks.append(sp.eye(n, len(coef) * n, format="csr"))
+        sense.append(np.full(n, GRB.LESS_EQUAL))
+        rhs.append(np.ones(n))
+    return obj, sp.vstack(blocks, format="csr"), np.concatenate(sense), np.concatenate(rhs)
+
+
+"""
+Constraint names of the primal LP, in row order
+"""
+def primal_names(n, myerson=False, pairs=None):
+    I, J = ic_pairs(n) if pairs is None else pairs
+    names = pair_names("IC", I, J) + index_names("IR", n) + ["supply"]
+    if myerson:
+        names += index_names("bound", n)
+    return names
+
+
+"""
+Build the dual LP in matrix form
+Dual variables are ordered ic[i,j], ir[i], bound[i], supply, with one >= constraint per primal variable
+:return: objective, constraint matrix, right-hand sides
+"""
+def dual_matrices(pop, q, LAMBDA, myerson=False):
+    n = pop.num_type
+    coef = utility_coefficients(pop, myerson)
+    I, J = ic_pairs(n)
+    cols = len(coef) * n
+
+    bound = sp.eye(cols, n, format="csr")  # x <= 1 only
+    supply = sp.csr_matrix((pop.pdf, (np.arange(n), np.zeros(n, dtype=int))), shape=(cols, 1))
+    A = sp.hstack([-ic_matrix(coef, I, J).T, -ir_matrix(coef).T, bound, supply], format="csr")
+
+    obj = np.zeros(A.shape[1])
+    obj[-n - 1:-1] = 1
+    obj[-1] = q
+
+    rhs = np.concatenate(coef) * np.tile(pop.pdf, len(coef))
+    rhs[n:2 * n] += LAMBDA * pop.pdf
+    return obj, A, rhs
+
+
+"""
+Find all violated IC constraints of a solution, in one vectorized pass over blocks of rows
+:param values: solution in variable order, i.e. x, p, w (x, p in the Myerson environment)
+:param tol: violations not larger than tol are ignored
+:return: arrays I, J of violated pairs (row-major order) and the violations u_i(j) - u_i(i)
+"""
+def ic_violations(pop, values, myerson=False, tol=1e-6):
+    n = pop.num_type
+    C = np.column_stack(utility_coefficients(pop, myerson))  # n * blocks
+    Z = np.reshape(values, (C.shape[1], n))  # blocks * n
+    own = np.einsum("ib,bi->i", C, Z)  # u_i(i)
+    chunk = max(1, 2 ** 22 // n)
+    I, J, gap = [], [], []
+    for start in range(0, n, chunk):
+        g = C[start:start + chunk] @ Z - own[start:start + chunk, None]
+        i, j = np.nonzero(g > tol)
+        I.append(i + start)
+        J.append(j)
+        gap.append(g[i, j])
+    return np.concatenate(I), np.concatenate(J), np.concatenate(gap)
@@ -1,13 +1,37 @@
 """
 Search for counterexamples based on solution pattern
+The iterations can be split across a pool of worker processes, each with its own Gurobi environment (if any)
+and its own random stream derived from a master seed. Workers stream counterexamples and progress
+back to the parent, and all of them stop once max_found counterexamples are found.
+A counterexample is an instance satisfying condition, an expression of the predicates of predicates.py,
+which can also be given on the command line, e.g. python counter_finder.py --condition "not mono(x, sm)".
+In the guided mode, instead of drawing the perturbations independently, each worker runs a cross-entropy
+search over the perturbations, maximizing the margin of the condition (see predicates.py), i.e. concentrating
+the samples around the instances closest to a counterexample. In the sobol and lhs modes, the perturbations
+are drawn from a scrambled Sobol sequence or Latin hypercubes (see sampler.py), covering the box more evenly
+than independent draws; every mode but guided reports the discrepancy of the perturbations drawn.
+Every solved instance is also counted by the pattern of its tight constraints, and with pattern_duals of its
+nonzero dual values (see patterns.py), so a run reports all the patterns occurring over the perturbations and their frequencies.
 
 Zejian Huang
 """
+import argparse
+import multiprocessing as mp
+import os
+import queue as queue_module
+import traceback
+
 import gurobipy as gp
+import numpy as np
+import population
 from population import Population
 from model import Model
-from dual import Dual
 from printer import print_solution, print_dual_solution
+from store import ResultStore, model_row
+from profiler import Profiler
+from patterns import PatternTable
+from predicates import parse
+from sampler import Sampler, uniform_discrepancy
 
 # parameters
 
@@ -15,89 +39,340 @@ LAMBDA = 50000  # social value for revenue
 n = 9  # number of types
 q = 1  # ex ante constraint
 v_precision = 4
+offset = 1e-3  # perturbations of vs, vm, vt are drawn from (-offset, offset)
 num_loop = 10000
+workers = os.cpu_count()  # number of worker processes
+seed = 0  # master seed of the random streams of the workers
+condition = "nonzero(ic, 1, 4) or nonzero(ic, 2, 5)"  # counterexample condition, see predicates.py
+# condition = "not mono(x, sm) and regular(vs)"
+# condition = "not mono(x, sm)"
+max_found = None  # stop after this many counterexamples, None to run all iterations
+print_found = 1  # counterexamples printed at the end
+mode = "random"  # "random": independent perturbations, "sobol", "lhs": low-discrepancy perturbations,
+# "guided": cross-entropy search on the margin of condition
+batch = 50  # guided: instances per generation
+elite = 0.2  # guided: share of a generation the distributions are refit to
+smoothing = 0.7  # guided: weight of the refit distributions against the previous ones
+min_std = 0.05  # guided: lower bound of the standard deviations of the perturbations, relative to offset
+patience = 10  # guided: restart after this many generations without improving the best margin
+progress = 1000  # report progress every this many iterations
+backend = "gurobi"  # LP solver, "gurobi" or "highs"
+store_path = None  # directory of a ResultStore of every solved instance, one store per worker, None for none
+profile = False  # time the stages of the search, see profiler.py
+profile_path = None  # file of the aggregated spans as JSON, or of cProfile dumps (per process) if it ends with .prof
+max_patterns = 20  # most frequent patterns printed
+pattern_duals = False  # also count nonzero dual values, which depend on the solve path for degenerate LPs
+pattern_path = None  # .npz file of the pattern table of the run, see patterns.load, None for none
+table_path = None  # directory of the on-disk tier of the generator cache, shared by the workers, None for memory only
+
+population.tables.path = table_path
+
+# spans of this process, the workers send theirs to the parent when done
+profiler = Profiler(profile, cprofile=str(profile_path).endswith(".prof"))
 
 """
-Functions checking counterexamples
+Search functions
 """
 '''
-Check whether x(vs/vm) is monotone non-decreasing
+Generate the values of a population, with a perturbation
+:param offsets: 3 * n array of the perturbations of vs, vm, vt, drawn at random if None
 '''
-def mono_s_over_m():
-    for i in range(n):
-        for j in range(n):
-            if round(solution[i].x, 8) < round(solution[j].x, 8) and round(pop.smList[i], 8) > round(pop.smList[j], 8):
-                # print(i + 1, solution[i].x, pop.smList[i])
-                # print(j + 1, solution[j].x, pop.smList[j])
-                return False
-    return True
+def generate(pop, offsets=None):
+    pop.clear_values()
+    pop.vsList = pop.value_uniform(1, 5)
+    pop.vmList = pop.value_uniform(2, 3)
+    pop.vtList = pop.value_uniform(4, 2)
+    if offsets is None:
+        pop.perturbation(-offset, offset, precision=v_precision)
+    else:
+        pop.vs = pop.vs + offsets[0]
+        pop.vm = pop.vm + offsets[1]
+        pop.vt = pop.vt + offsets[2]
+    distribute(pop)
 
 '''
-Check whether the dual variable IC[a,b] is 0
+Generate the type distribution of a population and calculate the derived values
 '''
-def dual_zero_IC(a, b):
-    name = "ic[" + str(a-1) + "," + str(b-1) + "]"
-    if d.getVarByName(name).x == 0:
-        return True
-    else:
-        return False
+def distribute(pop):
+    pop.type_uniform()
+    pop.calculate_ratio()
+    pop.calculate_virtual_s()
+    pop.calculate_virtual_sm()
+    pop.calculate_virtual_st()
+    pop.calculate_rec_hr_st()
 
-pop = Population(n)
-count = 0
-counter_ex = 0
-while count <= num_loop:
+class CrossEntropy:
+    '''
+    Cross-entropy search over the perturbations of vs, vm, vt, on the grid of v_precision in [-offset, offset]
+    The perturbations are drawn from independent normal distributions, starting centered with standard deviation
+    offset. After each generation of batch instances, the distributions are refit (smoothed by smoothing) to the
+    elite share of the generation with the largest margins, so that the samples concentrate around the instances
+    closest to a counterexample. The standard deviations stay above min_std * offset, and the search restarts
+    after patience generations without improving the best margin since the last restart.
+    :param rng: random generator
+    '''
+    def __init__(self, rng):
+        self.rng = rng
+        self.restart()
 
-    try:
-        '''
-        Generate population
-        '''
-        pop.clear_values()
-        pop.vsList = pop.value_uniform(1, 5)
-        pop.vmList = pop.value_uniform(2, 3)
-        pop.vtList = pop.value_uniform(4, 2)
-        pop.perturbation(-1e-3, 1e-3, precision=v_precision)
-        pop.type_uniform()
-        pop.calculate_ratio()
-        pop.calculate_virtual_s()
-
-        '''
-        Build model
-        '''
-        m = Model(pop, q, LAMBDA).m
-        d = Dual(pop, q, LAMBDA).m
-
-        # optimize model
+    def restart(self):
+        self.mean = np.zeros((3, n))
+        self.std = np.full((3, n), float(offset))
+        self.generation = []  # (margin, perturbations) of the current generation
+        self.best = -np.inf
+        self.stale = 0
+
+    '''
+    Perturbations of the next instance
+    '''
+    def propose(self):
+        return np.round(np.clip(self.rng.normal(self.mean, self.std), -offset, offset), v_precision)
+
+    '''
+    Record the margin of the perturbations of the last instance, -inf if it was not solved, and refit the
+    distributions at the end of a generation
+    '''
+    def update(self, offsets, margin):
+        self.generation.append((margin, offsets))
+        if len(self.generation) < batch:
+            return
+        self.generation.sort(key=lambda g: -g[0])
+        best = self.generation[0][0]
+        elites = np.array([g[1] for g in self.generation[:max(2, int(elite * batch))]])
+        self.generation = []
+        self.mean = smoothing * elites.mean(axis=0) + (1 - smoothing) * self.mean
+        self.std = np.maximum(smoothing * elites.std(axis=0) + (1 - smoothing) * self.std, min_std * offset)
+        if best > self.best:
+            self.best = best
+            self.stale = 0
+        else:
+            self.stale += 1
+            if self.stale >= patience:
+                self.restart()
+
+
+'''
+Build and solve the model of a population
+:param model: a model of a previous population, updated in place and re-optimized from its basis if given
+:return: the model, None if the model is unbounded or infeasible
+'''
+def solve(pop, env=None, model=None):
+    with profiler.span("build" if model is None else "update"):
+        if model is None:
+            model = Model(pop, q, LAMBDA, env=env, backend=backend)
+        else:
+            model.update_population(pop)
+    m = model.m
+
+    # optimize model
+    with profiler.span("optimize"):
         m.optimize()
-        d.optimize()
+    profiler.solver("primal", m)
 
-        # handle unbounded or infeasible
-        if m.status == 5:
-            print("unbounded")
-            continue
-        elif m.status == 3:
-            print("infeasible")
+    # handle unbounded or infeasible
+    if m.status == 5:
+        print("unbounded")
+        return None
+    elif m.status == 3:
+        print("infeasible")
+        try:
             m.computeIIS()
-            continue
+        except NotImplementedError as e:
+            print(e)
+        return None
+    return model
 
-        # solution
-        solution = m.getVars()
+'''
+Run iterations of the search in a worker process
+Whatever happens, the worker ends with a "done" message, whose error is the traceback of the exception that
+stopped it, None if it ran to the end.
+:param num_iter: number of solved instances to check
+:param seed_seq: seed of the random stream of this worker
+:param stop: event set when the search should stop
+:param queue: queue receiving ("progress", count), ("found", vs, vm, vt) and
+    ("done", pid, count, spans, patterns, (points, discrepancy, grid), error) messages
+:param path: directory of a ResultStore receiving every solved instance, None for none
+:param condition: counterexample condition, an expression of predicates
+:param mode: "random", "sobol", "lhs" or "guided"
+'''
+def search(num_iter, seed_seq, stop, queue, path=None, condition=condition, mode=mode):
+    env = None
+    store = None
+    sampler = None
+    patterns = PatternTable(n, pattern_duals)
+    count = 0
+    error = None
+    try:
+        is_counterexample = parse(condition, n)
+        if backend == "gurobi":
+            env = gp.Env(empty=True)
+            env.setParam("OutputFlag", 0)
+            env.start()
+        pop = Population(n, seed=seed_seq)
+        store = None if path is None else ResultStore(path)
+        guide = CrossEntropy(pop.rng) if mode == "guided" else None
+        sampler = None if mode == "guided" else Sampler(3 * n, mode, pop.rng)
+        model = None
+        while count < num_iter and not stop.is_set():
+
+            try:
+                '''
+                Generate population
+                '''
+                with profiler.span("generate"):
+                    if guide is not None:
+                        offsets = guide.propose()
+                    else:
+                        offsets = sampler.draw(-offset, offset, v_precision).reshape(3, n)
+                    generate(pop, offsets)
+
+                '''
+                Build and solve model, or update the one of the previous iteration
+                '''
+                solved = solve(pop, env, model)
+                if solved is None:
+                    model = None
+                    if guide is not None:
+                        guide.update(offsets, -np.inf)
+                    continue
+                model = solved
+                # solution, with the dual values read from the primal
+                with profiler.span("solution"):
+                    solution = model.solution()
+                if store is not None:
+                    with profiler.span("store"):
+                        store.append(**model_row(model, q))
+
+                # check counterexample conditions, send counterexample
+                count += 1
+                if count % progress == 0:
+                    queue.put(("progress", progress))
+                with profiler.span("pattern"):
+                    patterns.add(solution, pop)
+                with profiler.span("check"):
+                    found = is_counterexample(solution, pop)
+                    if guide is not None:
+                        guide.update(offsets, is_counterexample.margin(solution, pop))
+                if found:
+                    queue.put(("found", pop.vs, pop.vm, pop.vt))
+
+            except gp.GurobiError as e:
+                print('Error code ' + str(e.errno) + ': ' + e.message)
+
+            except AttributeError:
+                print('Encountered an attribute error')
+
+    except Exception:
+        error = traceback.format_exc()
+
+    finally:
+        if store is not None:
+            store.close()
+        if profiler.profile is not None:
+            profiler.dump_stats(profile_path[:-len(".prof")] + "_" + str(os.getpid()) + ".prof")
+        coverage = None
+        if sampler is not None and error is None:
+            coverage = (sampler.count(), sampler.discrepancy(), sampler.box)
+        queue.put(("done", os.getpid(), count % progress, profiler.raw(), patterns.raw(), coverage, error))
+        if env is not None:
+            env.dispose()
 
-        # check counterexample conditions, print counterexample and stop
-        count += 1
-        if count % 1000 == 0:
+'''
+Split the iterations across worker processes and collect their counterexamples and patterns
+A worker failing, with an exception or by exiting without its "done" message, stops the other workers, and the
+run raises a RuntimeError with the errors of the workers once all of them ended.
+:return: list of counterexamples, as populations, and the PatternTable of all workers
+'''
+def run(num_loop, workers, seed, max_found, condition=condition, mode=mode):
+    # reject a bad condition before starting the workers
+    parse(condition, n)
+    queue = mp.Queue()
+    stop = mp.Event()
+    sizes = [len(part) for part in np.array_split(np.arange(num_loop), workers)]
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+    paths = [None if store_path is None else os.path.join(store_path, "worker_%d" % k) for k in range(workers)]
+    procs = [mp.Process(target=search, args=(sizes[k], seeds[k], stop, queue, paths[k], condition, mode))
+             for k in range(workers)]
+    for proc in procs:
+        proc.start()
+
+    found = []
+    patterns = PatternTable(n, pattern_duals)
+    coverage = []
+    errors = []
+    done = set()
+    count = 0
+    while len(done) < workers:
+        try:
+            message = queue.get(timeout=1)
+        except queue_module.Empty:
+            # a worker exits after sending its "done" message, so an exited worker without one has crashed
+            for proc in procs:
+                if proc.pid not in done and proc.exitcode is not None:
+                    done.add(proc.pid)
+                    errors.append("worker %d exited with code %d" % (proc.pid, proc.exitcode))
+                    stop.set()
+            continue
+        if message[0] == "progress":
+            count += message[1]
             print(count)
-        # if not mono_s_over_m() and pop.mono_regularity_s():
-        # if not mono_s_over_m():
-        if not dual_zero_IC(1, 4) or not dual_zero_IC(2, 5):
-            counter_ex += 1
-            print_solution(m, pop, q, v_precision)
-            print_dual_solution(d, pop, q, v_precision)
-            exit(1)
+        elif message[0] == "found":
+            pop = Population(n)
+            pop.vsList, pop.vmList, pop.vtList = message[1:]
+            distribute(pop)
+            found.append(pop)
+            if max_found is not None and len(found) >= max_found:
+                stop.set()
+        else:
+            done.add(message[1])
+            count += message[2]
+            profiler.merge(message[3])
+            patterns.merge(message[4])
+            if message[5] is not None:
+                coverage.append(message[5])
+            if message[6] is not None:
+                errors.append("worker %d failed:\n%s" % (message[1], message[6]))
+                stop.set()
+    for proc in procs:
+        proc.join()
+    if errors:
+        raise RuntimeError("\n".join(errors))
+    report_coverage(coverage, mode)
+    return found, patterns
+
+'''
+Print the mean discrepancy of the perturbations drawn by the workers, each from its own sequence, next to the
+one of as many independent uniform points on the same grid
+:param coverage: list of (points, discrepancy, grid) of the workers, grid being (a, b, precision)
+'''
+def report_coverage(coverage, mode):
+    if not coverage:
+        return
+    points = int(np.mean([c[0] for c in coverage]))
+    print("discrepancy of the perturbations (%s, %d points per worker): %.4g, independent uniform: %.4g"
+          % (mode, points, np.mean([c[1] for c in coverage]), uniform_discrepancy(points, 3 * n, coverage[0][2])))
+
 
-    except gp.GurobiError as e:
-        print('Error code ' + e.errno + ': ' + e.message)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Search for counterexamples based on solution pattern")
+    parser.add_argument("--condition", default=condition, help="counterexample condition, see predicates.py")
+    parser.add_argument("--num-loop", type=int, default=num_loop, help="number of solved instances")
+    parser.add_argument("--workers", type=int, default=workers, help="number of worker processes")
+    parser.add_argument("--seed", type=int, default=seed, help="master seed of the random streams")
+    parser.add_argument("--max-found", type=int, default=max_found, help="stop after this many counterexamples")
+    parser.add_argument("--mode", choices=["random", "sobol", "lhs", "guided"], default=mode, help="sampling of the perturbations")
+    args = parser.parse_args()
+    print("condition: " + repr(parse(args.condition, n)))
 
-    except AttributeError:
-        print('Encountered an attribute error')
+    counter_ex, patterns = run(args.num_loop, args.workers, args.seed, args.max_found, args.condition, args.mode)
+    print(len(counter_ex))
+    profiler.report(profile_path)
+    patterns.print_summary(max_patterns)
+    if pattern_path is not None:
+        patterns.save(pattern_path)
 
-print(counter_ex)
+    # print counterexamples
+    for pop in counter_ex[:print_found]:
+        solution = solve(pop).solution()
+        print_solution(solution, pop, q, v_precision)
+        print_dual_solution(solution, pop, q, v_precision)
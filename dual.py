@@ -4,8 +4,12 @@ Module for building the dual linear programming model
 Zejian Huang
 """
 
-import gurobipy as gp
-from gurobipy import GRB, tuplelist
+import numpy as np
+from gurobipy import GRB
+
+from backend import Value, make_lp
+from builder import dual_matrices, ic_pairs, index_names, pair_names
+from solution import Solution
 
 
 class Dual:
@@ -16,70 +20,81 @@ class Dual:
     :param pop: a population instance
     :param q: ex ante constraint
     :param LAMBDA: social value for revenue
+    :param env: Gurobi environment of the model, the default environment if None
+    :param backend: LP solver, "gurobi" or "highs", see backend.py
     """
 
-    def __init__(self, pop, q, LAMBDA):
-        self.m = gp.Model("Dual")
-        self.m.Params.LogToConsole = 0
-        self.m.Params.DualReductions = 0
+    def __init__(self, pop, q, LAMBDA, env=None, backend="gurobi"):
+        self.m = make_lp(backend, "Dual", env)
 
         # variables
-        # ic = self.m.addVars(pop.num_type * (pop.num_type - 1), vtype=GRB.CONTINUOUS, name="ic", lb=0)  # ic[i]
-
-        ic_list = []
-        for i in range(pop.num_type):
-            for j in range(pop.num_type):
-                if i != j:
-                    ic_list.append((i, j))
-        ic = self.m.addVars(tuplelist(ic_list), vtype=GRB.CONTINUOUS, name="ic", lb=0)  # ic[i, j]
-        ir = self.m.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="ir", lb=0)
-        b = self.m.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="bound", lb=0)
-        sup = self.m.addVar(vtype=GRB.CONTINUOUS, name="supply", lb=0)
-
-        # objective
-        self.m.setObjective(q * sup + gp.quicksum(b), GRB.MINIMIZE)
-
-        # constraints using ic[i, j]
-        # x
-        self.m.addConstrs(
-            (
-                # IC constraints
-                gp.quicksum(-pop.vsList[i] * ic[i, j] for j in range(pop.num_type) if i != j)  # Ui >= Uj
-                + gp.quicksum(pop.vsList[j] * ic[j, i] for j in range(pop.num_type) if i != j)  # Uj >= Ui
-                # IR constraints
-                - pop.vsList[i] * ir[i]
-                # supply constraint
-                + pop.pdfList[i] * sup
-                # bound
-                + b[i]
-                >= pop.vsList[i] * pop.pdfList[i]
-                for i in range(pop.num_type)
-            ), "x"
-        )
-        # p
-        self.m.addConstrs(
-            (
-                # IC constraints
-                gp.quicksum(pop.vmList[i] * ic[i, j] for j in range(pop.num_type) if i != j)  # Ui >= Uj
-                + gp.quicksum(-pop.vmList[j] * ic[j, i] for j in range(pop.num_type) if i != j)  # Uj >= Ui
-                # IR constraints
-                + pop.vmList[i] * ir[i]
-                >= (LAMBDA - pop.vmList[i]) * pop.pdfList[i]
-                for i in range(pop.num_type)
-            ), "p"
-        )
-        # w
-        self.m.addConstrs(
-            (
-                # IC constraints
-                gp.quicksum(pop.vtList[i] * ic[i, j] for j in range(pop.num_type) if i != j)  # Ui >= Uj
-                + gp.quicksum(-pop.vtList[j] * ic[j, i] for j in range(pop.num_type) if i != j)  # Uj >= Ui
-                # IR constraints
-                + pop.vtList[i] * ir[i]
-                >= -pop.vtList[i] * pop.pdfList[i]
-                for i in range(pop.num_type)
-            ), "w"
-        )
+        obj, A, rhs = dual_matrices(pop, q, LAMBDA)
+        n = pop.num_type
+        I, J = ic_pairs(n)
+        k = len(I)
+        self.m.add_vars(0, np.inf, obj[:k], pair_names("ic", I, J))  # ic[i, j]
+        self.m.add_vars(0, np.inf, obj[k:k + n], index_names("ir", n))
+        self.m.add_vars(0, np.inf, obj[k + n:k + 2 * n], index_names("bound", n))
+        self.m.add_vars(0, np.inf, obj[-1:], ["supply"])
+
+        # objective: q * sup + sum(b)
+        self.m.set_maximize(False)
+
+        # constraints, one per primal variable x, p, w
+        self.m.add_rows(A, GRB.GREATER_EQUAL, rhs, index_names("x", n) + index_names("p", n) + index_names("w", n))
         # self.m.addConstr(b[4] = 0, "test")
 
+    """
+    Current solution of the dual, as the dual values and tight dual constraints of a Solution without primal values
+    :param tol: constraints with |slack| <= tol are tight
+    :return: a Solution
+    """
+    def solution(self, tol=1e-9):
+        X = self.m.get("X")
+        n = self.m.num_rows // 3
+        I, J = ic_pairs(n)
+        k = len(I)
+        ic = np.zeros((n, n))
+        ic[I, J] = X[:k]
+        dual = DualSolution(ic, X[k:k + n], X[k + n:k + 2 * n], X[-1], self.m.get("Slack"), self.m.ObjVal)
+        return Solution(self.m.ObjVal, dual=dual, tol=tol)
+
+
+
+
+class DualSolution:
+    """
+    Dual values of a solved primal model, read from the Pi and RC attributes of the primal
+    instead of building and solving the dual LP.
+    The values are exposed under the names of a solved Dual model, i.e. objVal, getVarByName("ic[i,j]").x
+    and getAttr("slack"); see also Solution, which printers and the counterexample checks consume.
+    :param ic: n * n array, ic[i, j] is the dual value of IC(i, j), 0 for IC constraints not in the model
+    :param ir: dual values of IR
+    :param bound: dual values of x <= 1
+    :param supply: dual value of the supply constraint
+    :param slack: slacks of the dual constraints x, p (and w), i.e. the reduced costs of the primal
+    :param objVal: objective value, equal to the primal objective value
+    """
+    def __init__(self, ic, ir, bound, supply, slack, objVal):
+        self.ic = ic
+        self.ir = ir
+        self.bound = bound
+        self.supply = supply
+        self.slack = slack
+        self.objVal = objVal
+
+    """
+    Look up a dual variable by its name in the Dual model, e.g. "ic[0,3]", "ir[2]", "supply"
+    """
+    def getVarByName(self, name):
+        prefix, _, index = name.partition("[")
+        value = getattr(self, prefix)
+        if index:
+            value = value[tuple(int(k) for k in index.rstrip("]").split(","))]
+        return Value(value)
+
+    def getAttr(self, attr):
+        if attr.lower() == "slack":
+            return self.slack
+        raise AttributeError("DualSolution has no attribute " + attr)
 
@@ -7,6 +7,8 @@ i.e., whether JM is sufficient for implementation.
 
 import random
 
+import numpy as np
+
 from population import Population
 
 x_list = []
@@ -27,6 +29,19 @@ def draw(num, max_w=1, precision=4):
         w_list.append(round(max_w*random.random(), precision))
 
 
+"""
+Draw a batch of random x's and w's, one candidate mechanism per row
+:param k: number of candidates
+:param rng: NumPy random generator, a new one if None
+:return: k * num arrays X, W
+"""
+def draw_batch(k, num, max_w=1, precision=4, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    X = np.round(rng.random((k, num)), precision)
+    W = np.round(max_w * rng.random((k, num)), precision)
+    return X, W
+
+
 """
 Clear lists
 """
@@ -49,6 +64,33 @@ def check_JM(num):
     return True
 
 
+"""
+Check the Joint Monotonicity condition for a batch of candidates at once
+[x_i - x_j] * [sm_i - sm_j] >= [w_i - w_j] * [tm_i - tm_j] for all pairs i != j.
+Both sides are symmetric in (i, j), so only the pairs i < j are evaluated, in chunks of candidates.
+:param X: k * n array, one candidate x per row
+:param W: k * n array, one candidate w per row
+:param sm: vs/vm of the types
+:param tm: vt/vm of the types
+:return: boolean mask of the candidates satisfying JM, and the worst violation of each candidate,
+    i.e. the largest [w_i - w_j] * [tm_i - tm_j] - [x_i - x_j] * [sm_i - sm_j] (0 for a single type)
+"""
+def check_JM_batch(X, W, sm, tm):
+    X = np.atleast_2d(X)
+    W = np.atleast_2d(W)
+    I, J = np.triu_indices(X.shape[1], 1)
+    d_sm = np.asarray(sm)[I] - np.asarray(sm)[J]
+    d_tm = np.asarray(tm)[I] - np.asarray(tm)[J]
+    worst = np.zeros(len(X))
+    chunk = max(1, 2 ** 22 // max(len(I), 1))
+    for start in range(0, len(X) if len(I) else 0, chunk):
+        x = X[start:start + chunk]
+        w = W[start:start + chunk]
+        gap = (w[:, I] - w[:, J]) * d_tm - (x[:, I] - x[:, J]) * d_sm
+        worst[start:start + chunk] = gap.max(axis=1)
+    return worst <= 0, worst
+
+
 if __name__ == '__main__':
     n = 9
     pop = Population(n)
@@ -56,8 +98,7 @@ if __name__ == '__main__':
     '''Generate vs, vm, vt'''
     pop.vsList = pop.value_kumaraswamy(1.75, 10, 8, 5, 0.75)
     pop.vmList = pop.value_uniform(1, 1)
-    for i in range(n):
-        pop.vtList.append(pop.vsList[i]**2)
+    pop.vtList = pop.vsList**2
     pop.calculate_ratio()
 
     '''Calculate derivatives of vs/vm and vt/vm'''
@@ -69,3 +110,9 @@ if __name__ == '__main__':
             d_sm_list.append(pop.smList[i] - pop.smList[i-1])
             d_tm_list.append(pop.tmList[i] - pop.tmList[i-1])
 
+    '''Check JM for a batch of random x's and w's'''
+    num_batch = 100000
+    X, W = draw_batch(num_batch, n)
+    mask, worst = check_JM_batch(X, W, pop.smList, pop.tmList)
+    print(str(mask.sum()) + " of " + str(num_batch) + " candidates satisfy JM")
+
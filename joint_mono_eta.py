@@ -7,8 +7,17 @@ Zejian Huang
 """
 
 import random
+
+import numpy as np
 from scipy.stats import expon
 
+# parameters
+k = 3  # number of points
+batch = 10 ** 6  # draws per batch
+max_batches = 1000  # stop after this many batches if the goal is never violated
+max_examples = 5  # goal violations kept as examples
+seed = None  # seed of the random generator
+
 
 def draw():
     xlist = []
@@ -61,14 +70,65 @@ def checkGoal(xlist, glist, etalist):
     return False
 
 
+# Draw a batch of k sorted x, g from U(0,1) and eta from Expo(1), one draw per row
+def drawBatch(size, k=3, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    x = np.sort(rng.random((size, k)), axis=1)
+    g = np.sort(rng.random((size, k)), axis=1)
+    eta = np.sort(rng.exponential(1, (size, k)), axis=1)
+    return x, g, eta
+
+
+# Check the IR and IC constraints of a batch of k points, v_i = i, as a mask of the rows satisfying them:
+# IC (j-i) * (x_j - x_i) >= (g_j - g_i) * (eta_j - eta_i) for i < j,
+# IR x_0 + ... + x_m >= eta_0 + ... + eta_m for m < k-1
+def checkJointMonoBatch(x, g, eta):
+    I, J = np.triu_indices(x.shape[1], 1)
+    ic = np.all((J - I) * (x[:, J] - x[:, I]) >= (g[:, J] - g[:, I]) * (eta[:, J] - eta[:, I]), axis=1)
+    ir = np.all(np.cumsum(x - eta, axis=1)[:, :-1] >= 0, axis=1)
+    return ic & ir
+
+
+# Check the goal inequality of a batch of k points, as a mask of the rows violating it, with both sides:
+# sum_j (x_j - x_0) < sum_j (g_j - g_{j-1}) * (eta_j - eta_0) for j = 1, ..., k-1
+def checkGoalBatch(x, g, eta):
+    lhs = x[:, 1:].sum(axis=1) - (x.shape[1] - 1) * x[:, 0]
+    rhs = (np.diff(g, axis=1) * (eta[:, 1:] - eta[:, :1])).sum(axis=1)
+    return lhs < rhs, lhs, rhs
+
+
+# Draw batches until the goal is violated or max_batches batches are drawn
+# Returns the numbers of draws, of draws satisfying IC and IR, of those violating the goal, and up to max_examples
+# violations as (x, g, eta, lhs, rhs)
+def sample(k=3, batch=10 ** 6, max_batches=1000, max_examples=5, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    draws = accepted = violated = 0
+    examples = []
+    for _ in range(max_batches):
+        x, g, eta = drawBatch(batch, k, rng)
+        draws += batch
+        mask = checkJointMonoBatch(x, g, eta)
+        x, g, eta = x[mask], g[mask], eta[mask]
+        accepted += len(x)
+        goal, lhs, rhs = checkGoalBatch(x, g, eta)
+        violated += int(goal.sum())
+        for i in np.flatnonzero(goal)[:max_examples - len(examples)]:
+            examples.append((x[i], g[i], eta[i], lhs[i], rhs[i]))
+        if violated:
+            break
+    return draws, accepted, violated, examples
+
+
 if __name__ == '__main__':
-    done = False
-    count = 0
-    while not done:
-        count += 1
-        x, g, eta = draw()
-        if checkJointMono(x, g, eta):
-            print(count)
-            if checkGoal(x, g, eta):
-                print(count)
-                done = True
+    draws, accepted, violated, examples = sample(k, batch, max_batches, max_examples, np.random.default_rng(seed))
+    print("draws: " + str(draws))
+    print("satisfying IC and IR: " + str(accepted))
+    print("violating the goal: " + str(violated))
+    for x, g, eta, lhs, rhs in examples:
+        print("x: ", end='')
+        print(x.tolist())
+        print("g: ", end='')
+        print(g.tolist())
+        print("eta: ", end='')
+        print(eta.tolist())
+        print(lhs, rhs)
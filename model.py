@@ -4,9 +4,15 @@ Module for building linear programming model
 Zejian Huang
 """
 
-import gurobipy as gp
+import numpy as np
 from gurobipy import GRB
 
+from backend import make_lp
+from builder import (ic_matrix, ic_pairs, ic_violations, index_names, local_pairs, pair_names, primal_matrices,
+                     primal_names, primal_objective, utility_coefficients)
+from dual import DualSolution
+from solution import primal_solution
+
 
 class Model:
     m = None
@@ -16,35 +22,50 @@ class Model:
     :param pop: a population instance
     :param q: ex ante constraint
     :param LAMBDA: social value for revenue
+    :param local_ic: only add IC constraints between adjacent types if the population is single crossing,
+        falling back to all IC constraints otherwise
+    :param lazy_ic: start with the IC constraints between adjacent types in the order of vs/vm, and let optimize
+        add violated IC constraints until none is violated
+    :param env: Gurobi environment of the model, the default environment if None
+    :param backend: LP solver, "gurobi" or "highs", see backend.py
     """
-    def __init__(self, pop, q, LAMBDA):
+    def __init__(self, pop, q, LAMBDA, local_ic=False, lazy_ic=False, env=None, backend="gurobi"):
+        self.pop = pop
+        self.LAMBDA = LAMBDA
+        self.lazy_ic = lazy_ic
+        # IC pairs in the model, None for all pairs
+        self.pairs = None
+        if local_ic or lazy_ic:
+            order = pop.single_crossing()
+            if order is None and lazy_ic:
+                order = np.argsort(pop.sm, kind="stable")
+            if order is not None:
+                self.pairs = local_pairs(order)
+        # rounds of optimization and number of IC constraints added by the lazy mode
+        self.rounds = 0
+        self.added = 0
 
-        self.m = gp.Model("SMT")
-        self.m.Params.LogToConsole = 0
-        self.m.Params.DualReductions = 0
+        self.m = make_lp(backend, "SMT", env)
 
         # variables
-        x = self.m.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="x", lb=0, ub=1)
-        p = self.m.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="p", lb=0)
-        w = self.m.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="w", lb=0)
+        obj, A, sense, rhs = primal_matrices(pop, q, LAMBDA, pairs=self.pairs)
+        n = pop.num_type
+        self.m.add_vars(0, 1, obj[:n], index_names("x", n))
+        self.m.add_vars(0, np.inf, obj[n:2 * n], index_names("p", n))
+        self.m.add_vars(0, np.inf, obj[2 * n:], index_names("w", n))
 
         # objective
-        self.m.setObjective(
-            gp.quicksum(
-                (pop.vsList[i] * x[i] - pop.vmList[i] * p[i] - pop.vtList[i] * w[i] + LAMBDA * p[i]) * pop.pdfList[i]
-                for i in range(pop.num_type)),
-            GRB.MAXIMIZE)
+        self.m.set_maximize()
 
         # constraints
-        # incentive compatibility
-        self.m.addConstrs((pop.vsList[i] * x[i] - pop.vmList[i] * p[i] - pop.vtList[i] * w[i] >=
-                           pop.vsList[i] * x[j] - pop.vmList[i] * p[j] - pop.vtList[i] * w[j]
-                           for i in range(pop.num_type) for j in range(pop.num_type) if i != j), "IC")
-        # individual rationality
-        self.m.addConstrs((pop.vsList[i] * x[i] - pop.vmList[i] * p[i] - pop.vtList[i] * w[i] >= 0
-                           for i in range(pop.num_type)), "IR")
-        # supply
-        self.m.addConstr(gp.quicksum(x[i] * pop.pdfList[i] for i in range(pop.num_type)) <= q, "supply")
+        # incentive compatibility, individual rationality, supply
+        self.m.add_rows(A, sense, rhs, primal_names(n, pairs=self.pairs))
+        # number of IC rows before IR, IC rows added later follow the supply row
+        self.num_ic = A.shape[0] - n - 1
+        self.supply = A.shape[0] - 1
+        # coefficients in the model, to find the changed ones in update_population
+        self.coef = [a.copy() for a in utility_coefficients(pop)]
+        self.pdf = pop.pdf.copy()
 
         # extra testing constraints
         # self.m.addConstr(gp.quicksum(p[i] for i in range(pop.num_type)) == 0, "no payment")
@@ -54,4 +75,150 @@ class Model:
         # self.m.addConstr(p[7] == 2.8333, "test")
         # self.m.addConstr(w[7] == 0.1, "test")
 
+    """
+    Change the ex ante constraint in place, keeping the current basis for the next optimization
+    """
+    def set_q(self, q):
+        self.m.set_rhs([self.supply], [q])
+
+    """
+    Change the social value for revenue in place, keeping the current basis for the next optimization
+    """
+    def set_lambda(self, LAMBDA):
+        self.LAMBDA = LAMBDA
+        n = self.pop.num_type
+        self.m.set_obj(np.arange(n, 2 * n), -self.pop.vm * self.pop.pdf + LAMBDA * self.pop.pdf)
+
+    """
+    Change the model in place to the one of another population with the same number of types,
+    rewriting only the changed coefficients and the objective, and keeping the current basis for the next
+    optimization. Every changed coefficient is one call to the solver, so this pays off for small n and
+    small perturbations, e.g. in counter_finder. In the local mode, the new population should stay single crossing.
+    :param pop: the new population
+    """
+    def update_population(self, pop):
+        n = pop.num_type
+        I, J, ic_rows = self.ic_rows()
+        coef = utility_coefficients(pop)
+        rows, cols, values = [], [], []
+        for block, (old, new) in enumerate(zip(self.coef, coef)):
+            changed = old != new
+            # IC rows u_i(i) - u_i(j) >= 0 of the changed types i
+            t = np.nonzero(changed[I])[0]
+            rows += [ic_rows[t], ic_rows[t]]
+            cols += [block * n + I[t], block * n + J[t]]
+            values += [new[I[t]], -new[I[t]]]
+            # IR rows
+            i = np.nonzero(changed)[0]
+            rows.append(self.num_ic + i)
+            cols.append(block * n + i)
+            values.append(new[i])
+        # supply
+        i = np.nonzero(self.pdf != pop.pdf)[0]
+        rows.append(np.full(len(i), self.supply))
+        cols.append(i)
+        values.append(pop.pdf[i])
+        self.m.set_coeffs(np.concatenate(rows), np.concatenate(cols), np.concatenate(values))
+        self.m.set_obj(np.arange(3 * n), primal_objective(pop, self.LAMBDA))
+
+        self.pop = pop
+        self.coef = [a.copy() for a in coef]
+        self.pdf = pop.pdf.copy()
+
+    """
+    Optimize the model
+    If only local IC constraints are in the model, verify the solution against all IC constraints.
+    In the lazy mode, add the most violated IC constraint of each type and re-optimize from the previous basis,
+    until no IC constraint is violated. The number of rounds and of added constraints are kept in rounds and added.
+    :param tol: violations not larger than tol are ignored
+    """
+    def optimize(self, tol=1e-6):
+        self.m.optimize()
+        self.rounds = 1
+        if self.pairs is None or self.m.status != GRB.OPTIMAL:
+            return
+        if not self.lazy_ic:
+            self.verify_ic(tol)
+            return
+        n = self.pop.num_type
+        while True:
+            I, J, gap = ic_violations(self.pop, self.m.get("X"), tol=tol)
+            new = ~np.isin(I * n + J, self.pairs[0] * n + self.pairs[1])
+            if not np.any(new):
+                break
+            # most violated IC constraint of each type
+            I, J, gap = I[new], J[new], gap[new]
+            rows = np.lexsort((-gap, I))
+            first = np.r_[True, I[rows][1:] != I[rows][:-1]]
+            self.add_ic(I[rows][first], J[rows][first])
+            self.m.optimize()
+            self.rounds += 1
+            if self.m.status != GRB.OPTIMAL:
+                break
+
+    """
+    Add IC constraints for the pairs (I, J) to the model
+    """
+    def add_ic(self, I, J):
+        A = ic_matrix(utility_coefficients(self.pop), I, J)
+        self.m.add_rows(A, GRB.GREATER_EQUAL, np.zeros(len(I)), pair_names("IC", I, J))
+        self.pairs = (np.concatenate([self.pairs[0], I]), np.concatenate([self.pairs[1], J]))
+        self.added += len(I)
+
+    """
+    Dual values of the current solution, read from the Pi and RC attributes instead of solving the dual LP
+    IC constraints not in the model (local and lazy modes) have dual value 0.
+    :return: a DualSolution, with the names and signs of the Dual model
+    """
+    def dual_values(self):
+        n = self.pop.num_type
+        pi = self.m.get("Pi")
+        rc = self.m.get("RC")
+        I, J, rows = self.ic_rows()
+        ic = np.zeros((n, n))
+        ic[I, J] = 0 - pi[rows]  # 0 - pi, not -pi, keeps zeros positive
+        # x <= 1 is a bound, its dual value is the positive part of the reduced cost of x
+        bound = np.maximum(rc[:n], 0)
+        slack = rc.copy()
+        slack[:n] -= bound
+        k = self.num_ic
+        return DualSolution(ic, 0 - pi[k:k + n], bound, pi[k + n], slack, self.m.ObjVal)
+
+    """
+    Current solution with its slacks, tight constraints and dual values, see solution.py
+    :param tol: constraints with |slack| <= tol are tight
+    :return: a Solution
+    """
+    def solution(self, tol=1e-9):
+        I, J, rows = self.ic_rows()
+        return primal_solution(self.m.ObjVal, self.m.get("X"), self.m.get("Slack"), I, J, rows, self.num_ic,
+                               self.dual_values(), tol)
 
+    """
+    Current solution
+    :return: arrays x, p, w
+    """
+    def values(self):
+        return np.split(self.m.get("X"), 3)
+
+    """
+    IC pairs in the model and their rows
+    :return: arrays I, J, rows
+    """
+    def ic_rows(self):
+        n = self.pop.num_type
+        I, J = ic_pairs(n) if self.pairs is None else self.pairs
+        rows = np.arange(len(I))
+        rows[self.num_ic:] += n + 1
+        return I, J, rows
+
+    """
+    Check the current solution against all pairwise IC constraints and report the violated ones
+    :param tol: violations not larger than tol are ignored
+    :return: arrays I, J of violated pairs and the violations u_i(j) - u_i(i)
+    """
+    def verify_ic(self, tol=1e-6):
+        I, J, gap = ic_violations(self.pop, self.m.get("X"), tol=tol)
+        for i, j, g in zip(I, J, gap):
+            print("IC({i}, {j}) violated by {g:g}".format(i=i + 1, j=j + 1, g=g))
+        return I, J, gap
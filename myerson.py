@@ -1,111 +1,249 @@
 """
 Module for building LP models in the Myerson environment
 Setting: single parameter environment
+The primal is also solved in closed form (closed_form), the LP serving as a cross-check.
 
 Zejian Huang
 """
 
-import gurobipy as gp
-from gurobipy import GRB, tuplelist
+import numpy as np
+from gurobipy import GRB
+
+from backend import Value, make_lp
+from builder import (dual_matrices, ic_pairs, ic_violations, index_names, local_pairs, pair_names, primal_matrices,
+                     primal_names)
+from dual import DualSolution
+from population import pool
+from solution import primal_solution
 
 
 class Myerson:
     primal = None
-    dual = None
+    _dual = None
 
     """
-    Build the LP model, both primal and dual
+    Build the primal LP model, the dual LP model is built on first access of dual
     :param pop: a population instance
     :param q: ex ante constraint
     :param LAMBDA: social value for revenue
+    :param local_ic: only add IC constraints between adjacent types in the primal if vs is strictly increasing
+    :param env: Gurobi environment of the models, the default environment if None
+    :param backend: LP solver of the models, "gurobi" or "highs", see backend.py
     """
 
-    def __init__(self, pop, q, LAMBDA, rev_max=True):
-        self.build_primal(pop, q, LAMBDA, rev_max)
-        self.build_dual(pop, q, LAMBDA, rev_max)
+    def __init__(self, pop, q, LAMBDA, rev_max=True, local_ic=False, env=None, backend="gurobi"):
+        self.pop = pop
+        self.env = env
+        self.backend = backend
+        self.q = q
+        self.LAMBDA = LAMBDA
+        self.rev_max = rev_max
+        self.build_primal(pop, q, LAMBDA, rev_max, local_ic)
+
+    """
+    The dual LP model, built when first used
+    The dual values of a solved primal are also available without it, see dual_values.
+    """
+    @property
+    def dual(self):
+        if self._dual is None:
+            self.build_dual(self.pop, self.q, self.LAMBDA, self.rev_max)
+        return self._dual
 
     """
     Build the primal LP model
+    :param local_ic: only add IC constraints between adjacent types if the population is single crossing,
+        falling back to all IC constraints otherwise
     """
-    def build_primal(self, pop, q, LAMBDA, rev_max=True):
-        self.primal = gp.Model("primal")
-        self.primal.Params.LogToConsole = 0
-        self.primal.Params.DualReductions = 0
+    def build_primal(self, pop, q, LAMBDA, rev_max=True, local_ic=False):
+        # IC pairs in the primal, None for all pairs
+        self.pairs = None
+        if local_ic:
+            order = pop.single_crossing(myerson=True)
+            if order is not None:
+                self.pairs = local_pairs(order)
+
+        self.primal = make_lp(self.backend, "primal", self.env)
 
         # variables
-        x = self.primal.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="x", lb=0)
-        p = self.primal.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="p", lb=0)
+        obj, A, sense, rhs = primal_matrices(pop, q, LAMBDA, myerson=True, pairs=self.pairs)
+        self.num_ic = A.shape[0] - 2 * pop.num_type - 1
+        n = pop.num_type
+        self.primal.add_vars(0, np.inf, obj[:n], index_names("x", n))
+        self.primal.add_vars(0, np.inf, obj[n:], index_names("p", n))
 
-        self.primal.setObjective(
-            gp.quicksum(
-                (pop.vsList[i] * x[i] - p[i] + LAMBDA * p[i]) * pop.pdfList[i] for i in range(pop.num_type)
-            ),
-            GRB.MAXIMIZE
-        )
+        self.primal.set_maximize()
 
         # constraints
-        # incentive compatibility
-        self.primal.addConstrs((pop.vsList[i] * x[i] - p[i] >= pop.vsList[i] * x[j] - p[j]
-                                for i in range(pop.num_type) for j in range(pop.num_type) if i != j),
-                               "IC")
-        # individual rationality
-        self.primal.addConstrs((pop.vsList[i] * x[i] - p[i] >= 0 for i in range(pop.num_type)),
-                               "IR")
-        # supply
-        self.primal.addConstr(gp.quicksum(x[i] * pop.pdfList[i] for i in range(pop.num_type)) <= q, "supply")
-        # bound
-        self.primal.addConstrs((x[i] <= 1 for i in range(pop.num_type)), "bound")
+        # incentive compatibility, individual rationality, supply, bound
+        self.primal.add_rows(A, sense, rhs, primal_names(n, myerson=True, pairs=self.pairs))
 
         # self.primal.addConstr(p[1] >= 0.6, "test")
 
+    """
+    Optimize the primal, and verify the solution against all IC constraints if only local ones are in the model
+    """
+    def optimize(self):
+        self.primal.optimize()
+        if self.pairs is not None and self.primal.status == GRB.OPTIMAL:
+            self.verify_ic()
+
+    """
+    Dual values of the current primal solution, read from the Pi and RC attributes instead of solving the dual LP
+    IC constraints not in the primal (local mode) have dual value 0.
+    :return: a DualSolution, with the names and signs of the dual model
+    """
+    def dual_values(self):
+        n = self.pop.num_type
+        k = self.num_ic
+        pi = self.primal.get("Pi")
+        I, J = ic_pairs(n) if self.pairs is None else self.pairs
+        ic = np.zeros((n, n))
+        ic[I, J] = 0 - pi[:k]  # 0 - pi, not -pi, keeps zeros positive
+        return DualSolution(ic, 0 - pi[k:k + n], pi[k + n + 1:], pi[k + n], self.primal.get("RC"),
+                            self.primal.ObjVal)
+
+    """
+    Current primal solution with its slacks, tight constraints and dual values, see solution.py
+    :param tol: constraints with |slack| <= tol are tight
+    :return: a Solution
+    """
+    def solution(self, tol=1e-9):
+        I, J = ic_pairs(self.pop.num_type) if self.pairs is None else self.pairs
+        return primal_solution(self.primal.ObjVal, self.primal.get("X"), self.primal.get("Slack"), I, J,
+                               np.arange(len(I)), self.num_ic, self.dual_values(), tol, myerson=True)
+
+    """
+    Check the current primal solution against all pairwise IC constraints and report the violated ones
+    :param tol: violations not larger than tol are ignored
+    :return: arrays I, J of violated pairs and the violations u_i(j) - u_i(i)
+    """
+    def verify_ic(self, tol=1e-6):
+        I, J, gap = ic_violations(self.pop, self.primal.get("X"), myerson=True, tol=tol)
+        for i, j, g in zip(I, J, gap):
+            print("IC({i}, {j}) violated by {g:g}".format(i=i + 1, j=j + 1, g=g))
+        return I, J, gap
+
     """
     Build the dual LP model
     """
     def build_dual(self, pop, q, LAMBDA, rev_max):
-        self.dual = gp.Model("dual")
-        self.dual.Params.LogToConsole = 0
-        self.dual.Params.DualReductions = 0
+        self._dual = make_lp(self.backend, "dual", self.env)
 
         # variables
-        ic_list = []
-        for i in range(pop.num_type):
-            for j in range(pop.num_type):
-                if i != j:
-                    ic_list.append((i, j))
-        ic = self.dual.addVars(tuplelist(ic_list), vtype=GRB.CONTINUOUS, name="ic", lb=0)  # ic[i, j]
-        ir = self.dual.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="ir", lb=0)
-        b = self.dual.addVars(pop.num_type, vtype=GRB.CONTINUOUS, name="bound", lb=0)
-        sup = self.dual.addVar(vtype=GRB.CONTINUOUS, name="supply", lb=0)
-
-        # objective
-        self.dual.setObjective(q * sup + gp.quicksum(b), GRB.MINIMIZE)
+        obj, A, rhs = dual_matrices(pop, q, LAMBDA, myerson=True)
+        n = pop.num_type
+        I, J = ic_pairs(n)
+        k = len(I)
+        self._dual.add_vars(0, np.inf, obj[:k], pair_names("ic", I, J))  # ic[i, j]
+        self._dual.add_vars(0, np.inf, obj[k:k + n], index_names("ir", n))
+        self._dual.add_vars(0, np.inf, obj[k + n:k + 2 * n], index_names("bound", n))
+        self._dual.add_vars(0, np.inf, obj[-1:], ["supply"])
 
-        # constraints
-        "x"
-        self.dual.addConstrs(
-            (
-                # IC constraints
-                gp.quicksum(-pop.vsList[i] * ic[i, j] for j in range(pop.num_type) if i != j)  # Ui >= Uj
-                + gp.quicksum(pop.vsList[j] * ic[j, i] for j in range(pop.num_type) if i != j)  # Uj >= Ui
-                # IR constraints
-                - pop.vsList[i] * ir[i]
-                # supply constraint
-                + pop.pdfList[i] * sup
-                # bound
-                + b[i]
-                >= pop.vsList[i] * pop.pdfList[i]
-                for i in range(pop.num_type)
-            ), "x"
-        ),
-        "p"
-        self.dual.addConstrs(
-            (
-                # IC constraints
-                gp.quicksum(ic[i, j] for j in range(pop.num_type) if i != j)  # Ui >= Uj
-                + gp.quicksum(-ic[j, i] for j in range(pop.num_type) if i != j)  # Uj >= Ui
-                # IR constraints
-                + ir[i]
-                >= (LAMBDA - 1) * pop.pdfList[i]
-                for i in range(pop.num_type)
-            ), "p"
-        )
+        # objective: q * sup + sum(b)
+        self._dual.set_maximize(False)
+
+        # constraints, one per primal variable x, p
+        self._dual.add_rows(A, GRB.GREATER_EQUAL, rhs, index_names("x", n) + index_names("p", n))
+
+
+"""
+Solve the primal in closed form in linear time, without an LP
+For a monotone allocation x, the payments maximizing (LAMBDA >= 1) or minimizing (LAMBDA < 1) the revenue are
+given by the binding downward or upward adjacent IC constraints, so the objective is linear in x with one
+coefficient per type: f_i * vs_i + (LAMBDA - 1) * (virtual value of type i) * f_i.
+These coefficients are ironed by pool adjacent violators, and the supply goes to the ironed blocks with
+the highest positive coefficients, the marginal block sharing the remaining supply.
+With LAMBDA >= 1 and cdf = cumsum(pdf), the virtual values are those of Population.calculate_virtual_s.
+:param pop: a population instance, with strictly increasing vs
+:param q: ex ante constraint
+:param LAMBDA: social value for revenue
+:param tol: slacks not larger than tol are reported as 0, i.e. the constraint is tight
+:return: a MyersonSolution
+"""
+def closed_form(pop, q, LAMBDA, tol=1e-9):
+    vs = pop.vs
+    f = pop.pdf
+    if np.any(np.diff(vs) <= 0):
+        raise ValueError("the closed form needs strictly increasing vs")
+    above = np.zeros(len(f))  # probability of the types above
+    above[:-1] = np.cumsum(f[::-1])[::-1][1:]
+    lower = np.zeros(len(f))  # vs of the type below, 0 for the lowest type
+    lower[1:] = vs[:-1]
+
+    # revenue coefficients of x
+    if LAMBDA >= 1:
+        revenue = f * vs
+        revenue[:-1] -= above[:-1] * np.diff(vs)
+    else:
+        revenue = lower * (f + above) - vs * above
+    coef = f * vs + (LAMBDA - 1) * revenue
+
+    # allocate the supply to the ironed blocks, from the highest coefficient down
+    _, start = pool(coef, f)
+    total = np.add.reduceat(coef, start[:-1])
+    mass = np.add.reduceat(f, start[:-1])
+    before = np.zeros(len(mass))  # mass of the blocks above
+    before[:-1] = np.cumsum((mass * (total > 0))[::-1])[::-1][1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.clip((q - before) / mass, 0, 1)
+    share[mass == 0] = 1
+    x = np.repeat(np.where(total > 0, share, 0), np.diff(start))
+
+    # payments
+    if LAMBDA >= 1:
+        p = vs * x
+        p[1:] -= np.cumsum(np.diff(vs) * x[:-1])
+    else:
+        p = np.cumsum(lower * np.diff(x, prepend=0))
+    objVal = f @ (vs * x) + (LAMBDA - 1) * (f @ p)
+    return MyersonSolution(pop, q, x, p, objVal, tol)
+
+
+class MyersonSolution:
+    """
+    Solution of the primal in the Myerson environment, computed by closed_form.
+    The values are exposed like those of a solved primal, i.e. objVal, getVars()[i].x, getVarByName("x[i]").x
+    and getAttr("slack"), and as a Solution by solution(), so that it can be printed and stored like the LP.
+    :param x: allocation
+    :param p: payments
+    :param objVal: objective value
+    :param tol: slacks not larger than tol are reported as 0
+    """
+    def __init__(self, pop, q, x, p, objVal, tol=1e-9):
+        self.pop = pop
+        self.q = q
+        self.x = x
+        self.p = p
+        self.objVal = objVal
+        self.tol = tol
+
+    def getVars(self):
+        return [Value(v) for v in np.concatenate([self.x, self.p])]
+
+    """
+    Look up a variable by its name in the primal, e.g. "x[0]", "p[2]"
+    """
+    def getVarByName(self, name):
+        prefix, _, index = name.partition("[")
+        return Value(getattr(self, prefix)[int(index.rstrip("]"))])
+
+    """
+    Slacks of the rows of the primal with all IC constraints, in row order, computed on demand in O(n^2)
+    """
+    def getAttr(self, attr):
+        if attr.lower() != "slack":
+            raise AttributeError("MyersonSolution has no attribute " + attr)
+        _, A, _, rhs = primal_matrices(self.pop, self.q, 0, myerson=True)
+        slack = rhs - A @ np.concatenate([self.x, self.p])
+        slack[np.abs(slack) <= self.tol] = 0
+        return slack
+
+    """
+    Solution with the slacks and tight constraints of the primal with all IC constraints, computed in O(n^2),
+    without dual values
+    """
+    def solution(self):
+        I, J = ic_pairs(len(self.x))
+        return primal_solution(self.objVal, np.concatenate([self.x, self.p]), self.getAttr("slack"), I, J,
+                               np.arange(len(I)), len(I), tol=self.tol, myerson=True)
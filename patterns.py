@@ -0,0 +1,130 @@
+"""
+Module for counting the patterns of tight constraints, and optionally nonzero dual values, over many solved
+instances
+Each solution is reduced to its fingerprint (see Solution.fingerprint), counted in a hash table with one
+representative population per pattern, so that one long run answers questions about every pattern,
+e.g. how often IC(1, 4) is tight, without re-running the search per question.
+The nonzero dual values of degenerate LPs depend on the solve path (see solution.py), so with duals the
+patterns of the same instances may differ between runs, e.g. with another split across workers.
+
+Zejian Huang
+"""
+
+import numpy as np
+from prettytable import PrettyTable
+
+from solution import unpack_fingerprint
+
+
+class PatternTable:
+    """
+    :param n: number of types
+    :param duals: count the nonzero dual sets with the tight sets, see Solution.fingerprint
+    """
+    def __init__(self, n, duals=False):
+        self.n = n
+        self.duals = duals
+        self.counts = {}  # fingerprint: number of instances
+        self.examples = {}  # fingerprint: (vs, vm, vt) of the first instance
+
+    """
+    Count the pattern of a solution of a population, keeping the population if the pattern is new
+    """
+    def add(self, solution, pop):
+        fingerprint = solution.fingerprint(self.duals)
+        count = self.counts.get(fingerprint, 0)
+        if count == 0:
+            self.examples[fingerprint] = (pop.vs, pop.vm, pop.vt)
+        self.counts[fingerprint] = count + 1
+
+    """
+    Add the counts of another table, e.g. of a worker process, given by its raw() data
+    """
+    def merge(self, raw):
+        counts, examples = raw
+        for fingerprint, count in counts.items():
+            if fingerprint not in self.counts:
+                self.counts[fingerprint] = 0
+                self.examples[fingerprint] = examples[fingerprint]
+            self.counts[fingerprint] += count
+
+    """
+    Counts and representatives, plain dicts to be sent between processes
+    """
+    def raw(self):
+        return self.counts, self.examples
+
+    def total(self):
+        return sum(self.counts.values())
+
+    """
+    Patterns from the most frequent
+    :param k: number of patterns, all if None
+    :return: list of (fingerprint, count)
+    """
+    def most_common(self, k=None):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:k]
+
+    """
+    Number of instances whose pattern satisfies a predicate
+    :param predicate: function of the masks of a pattern, see solution.unpack_fingerprint,
+        e.g. lambda m: m["tight_ic"][0, 3]
+    """
+    def count(self, predicate):
+        return sum(c for fingerprint, c in self.counts.items()
+                   if predicate(unpack_fingerprint(fingerprint, self.n, self.duals)))
+
+    """
+    Write the table as an .npz file of fingerprints (one row of bytes each), counts and representatives
+    """
+    def save(self, path):
+        items = self.most_common()
+        fingerprints = np.array([np.frombuffer(f, dtype=np.uint8) for f, _ in items]).reshape(len(items), -1)
+        examples = [self.examples[f] for f, _ in items]
+        np.savez(path, n=self.n, duals=self.duals, fingerprints=fingerprints, counts=np.array([c for _, c in items], dtype=np.int64),
+                 vs=np.array([e[0] for e in examples]).reshape(len(items), self.n),
+                 vm=np.array([e[1] for e in examples]).reshape(len(items), self.n),
+                 vt=np.array([e[2] for e in examples]).reshape(len(items), self.n))
+
+    """
+    Print the most frequent patterns with their share of the instances
+    """
+    def print_summary(self, k=20):
+        total = self.total()
+        print("patterns: %d, instances: %d" % (len(self.counts), total))
+        t = PrettyTable(["count", "share", "tight IC", "tight IR", "supply"]
+                        + (["nonzero dual IC", "nonzero dual IR"] if self.duals else []))
+        for fingerprint, count in self.most_common(k):
+            masks = unpack_fingerprint(fingerprint, self.n, self.duals)
+            row = [count, "%.2f%%" % (100 * count / total), pair_list(masks["tight_ic"]),
+                   index_list(masks["tight_ir"]), "tight" if masks["tight_supply"] else "_____"]
+            if self.duals:
+                row += [pair_list(masks["nonzero_ic"]), index_list(masks["nonzero_ir"])]
+            t.add_row(row)
+        print(t)
+
+
+"""
+Read a table written by PatternTable.save
+"""
+def load(path):
+    with np.load(path) as data:
+        table = PatternTable(int(data["n"]), bool(data["duals"]) if "duals" in data.files else True)
+        for k, fingerprint in enumerate(data["fingerprints"]):
+            table.counts[fingerprint.tobytes()] = int(data["counts"][k])
+            table.examples[fingerprint.tobytes()] = (data["vs"][k], data["vm"][k], data["vt"][k])
+    return table
+
+
+"""
+Pairs of an n * n mask, 1-indexed, e.g. "(1,4) (2,5)"
+"""
+def pair_list(mask):
+    return " ".join("(%d,%d)" % (i + 1, j + 1) for i, j in zip(*np.nonzero(mask)))
+
+
+"""
+Indices of a mask, 1-indexed, e.g. "1 2 3"
+"""
+def index_list(mask):
+    return " ".join(str(i + 1) for i in np.flatnonzero(mask))
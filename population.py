@@ -2,119 +2,291 @@
 Module for a population, which contains distributions of values for service, money, and time
 Setting: vm = 1 - vt, uniform on (0,1), vs = g(vm) for g increasing, converted to discrete case
 
+Every quantity of a population is stored per instance as a contiguous float64 NumPy array.
+The old list attributes (vsList, pdfList, vir_vsList, ...) are kept as views of these arrays.
+The deterministic generators (value_*, type_*) are memoized in the module-level TableCache `tables`
+and return read-only arrays shared between populations; perturbation and the calculate_* methods
+build new arrays, so only code writing into these arrays in place needs to copy them first.
+
 Zejian Huang
 """
 
-import random
+import collections
+import functools
+import hashlib
+import numbers
+import os
+
+import numpy as np
 
 from scipy.stats import beta, geom, expon
-from scipy.optimize import fsolve
 
 
-class Population:
-    # number of type
-    num_type = 0
+"""
+Convert values to a contiguous float64 array
+"""
+def as_array(values):
+    return np.ascontiguousarray(values, dtype=np.float64)
+
+
+"""
+Expose an array attribute under its old list name
+"""
+def list_view(attr):
+    def fget(self):
+        return getattr(self, attr)
+
+    def fset(self, values):
+        setattr(self, attr, as_array(values))
+    return property(fget, fset)
+
+
+"""
+Pool adjacent violators: merge adjacent blocks of types until the block means total / mass are nondecreasing,
+i.e. take the slopes of the convex hull of the cumulative curve of (mass, total). Linear time.
+Means are compared cross-multiplied, so types of mass 0 are pooled with their neighbours.
+:param totals: weighted value of each type, e.g. virtual value times pdf
+:param masses: weight of each type, e.g. pdf
+:return: mean of the block of each type, and the first type of each block followed by n
+"""
+def pool(totals, masses):
+    tot, mass, start = [], [], []
+    for i, (t, m) in enumerate(zip(np.asarray(totals).tolist(), np.asarray(masses).tolist())):
+        tot.append(t)
+        mass.append(m)
+        start.append(i)
+        while len(tot) > 1 and (tot[-2] * mass[-1] > tot[-1] * mass[-2]
+                                or mass[-1] == 0 and tot[-1] == 0 or mass[-2] == 0 and tot[-2] == 0):
+            t, m = tot.pop(), mass.pop()
+            tot[-1] += t
+            mass[-1] += m
+            start.pop()
+    start.append(len(np.asarray(masses)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = np.array(tot) / np.array(mass)
+    return np.repeat(means, np.diff(start)), np.array(start)
+
+
+"""
+CDF of the mixture Kumaraswamy distribution, q*(1-(1-x^a)^b) + (1-q)*(1-(1-x^c)^d) on [0, 1]
+"""
+def kumaraswamy_cdf(x, a, b, c, d, q):
+    return q * (1 - (1 - x**a)**b) + (1 - q) * (1 - (1 - x**c)**d)
+
+
+"""
+Quantiles of the mixture Kumaraswamy distribution, all solved at once on arrays
+Each root stays bracketed in [lo, hi], starting from [0, 1] since the CDF is increasing. Safeguarded Newton
+steps (bisection when a step leaves the bracket) run until the steps are below tol / 2, then the bracket of
+each quantile is narrowed to [x - tol/2, x + tol/2] where the CDF changes sign there, and bisected otherwise.
+:param cdfs: probabilities in [0, 1]
+:param tol: width of the final brackets, so each quantile is within tol / 2 of the root
+:param max_iter: bound of the Newton steps, and of the bisection steps (60 halve [0, 1] to the float spacing)
+:return: array of quantiles
+"""
+def kumaraswamy_ppf(cdfs, a, b, c, d, q, tol=1e-12, max_iter=100):
+    cdfs = np.asarray(cdfs, dtype=np.float64)
+    lo = np.zeros_like(cdfs)
+    hi = np.ones_like(cdfs)
+    x = np.full_like(cdfs, 0.5)
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for _ in range(max_iter):
+            f = kumaraswamy_cdf(x, a, b, c, d, q) - cdfs
+            lo = np.where(f <= 0, x, lo)
+            hi = np.where(f >= 0, x, hi)
+            xa, xc = x**a, x**c
+            df = q * a*b * xa / x * (1 - xa)**(b-1) + (1 - q) * c*d * xc / x * (1 - xc)**(d-1)
+            new = x - f / df
+            new = np.where((new > lo) & (new < hi), new, (lo + hi) / 2)
+            step = np.max(np.abs(new - x), initial=0)
+            x = new
+            if step <= tol / 2:
+                break
+        left = np.clip(x - tol / 2, 0, 1)
+        right = np.clip(x + tol / 2, 0, 1)
+        lo = np.where(kumaraswamy_cdf(left, a, b, c, d, q) <= cdfs, np.maximum(lo, left), lo)
+        hi = np.where(kumaraswamy_cdf(right, a, b, c, d, q) >= cdfs, np.minimum(hi, right), hi)
+        # at most max_iter halvings, as a tol below the float spacing of a bracket would never be reached
+        for _ in range(max_iter):
+            if not np.any(hi - lo > tol):
+                break
+            mid = (lo + hi) / 2
+            f = kumaraswamy_cdf(mid, a, b, c, d, q) - cdfs
+            lo = np.where(f <= 0, mid, lo)
+            hi = np.where(f >= 0, mid, hi)
+    return (lo + hi) / 2
+
+
+class TableCache:
+    """
+    Bounded LRU cache of generated arrays, with an optional on-disk tier shared by processes
+    Entries are tuples of read-only arrays, keyed by (generator, n, parameters).
+    :param maxsize: number of entries kept in memory
+    :param path: directory of the on-disk tier, one .npz file per entry, None for memory only
+    """
+    def __init__(self, maxsize=256, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    """
+    Entry of a key, computed by compute() (a tuple of arrays) if neither in memory nor on disk
+    """
+    def get(self, key, compute):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        file = None if self.path is None else os.path.join(self.path, self.file_name(key))
+        if file is not None and os.path.exists(file):
+            with np.load(file) as data:
+                values = tuple(data["arr_" + str(i)] for i in range(len(data.files)))
+            self.hits += 1
+        else:
+            values = tuple(as_array(v) for v in compute())
+            self.misses += 1
+            if file is not None:
+                # written under a temporary name and renamed, so other processes never read a partial file
+                os.makedirs(self.path, exist_ok=True)
+                temp = file[:-len(".npz")] + "." + str(os.getpid()) + ".tmp.npz"
+                np.savez(temp, *values)
+                os.replace(temp, file)
+        for v in values:
+            v.flags.writeable = False
+        self.entries[key] = values
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return values
+
+    """
+    Name of the file of a key, a hash of the key with its numbers as Python floats
+    """
+    @staticmethod
+    def file_name(key):
+        def plain(v):
+            if isinstance(v, (tuple, list)):
+                return tuple(plain(u) for u in v)
+            if isinstance(v, numbers.Real) and not isinstance(v, bool):
+                return float(v)
+            return v
+        return hashlib.sha1(repr(plain(key)).encode()).hexdigest() + ".npz"
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+# cache of the generators of all populations
+tables = TableCache()
+
+
+"""
+Memoize a generator method of Population in tables, keyed by its name, the number of types and its arguments.
+The generator returns an array or a tuple of arrays, returned read-only.
+"""
+def cached(generator):
+    @functools.wraps(generator)
+    def wrapper(self, *args, **kwargs):
+        key = (generator.__name__, self.num_type, args, tuple(sorted(kwargs.items())))
+        values = tables.get(key, lambda: as_tuple(generator(self, *args, **kwargs)))
+        return values if len(values) > 1 else values[0]
+    return wrapper
+
+
+def as_tuple(values):
+    return values if isinstance(values, tuple) else (values,)
+
 
+class Population:
+    # old list names, views of the per-instance arrays
     # values
-    vsList = []
-    vmList = []
-    vtList = []
+    vsList = list_view("vs")
+    vmList = list_view("vm")
+    vtList = list_view("vt")
     # distribution
-    pdfList = []
-    cdfList = []
+    pdfList = list_view("pdf")
+    cdfList = list_view("cdf")
     # ratio of values
-    smList = []
-    tmList = []
-    stList = []
+    smList = list_view("sm")
+    tmList = list_view("tm")
+    stList = list_view("st")
     # virtual values
-    vir_vsList = []
-    vir_smList = []
-    vir_stList = []
+    vir_vsList = list_view("vir_vs")
+    vir_smList = list_view("vir_sm")
+    vir_stList = list_view("vir_st")
     # hazard rate
-    h_rate = []
-    rec_hr_st = []
+    h_rate = list_view("hr")
+    rec_hr_st = list_view("rec_hr")
 
-    def __init__(self, num_type):
+    """
+    :param num_type: number of types
+    :param seed: seed of the random generator used by draw_uniform and perturbation
+    """
+    def __init__(self, num_type, seed=None):
+        # number of type
         self.num_type = num_type
+        self.rng = np.random.default_rng(seed)
+        self.clear_values()
 
     """
     draw random values from uniform (a, b) and sort (ascending)
     :param precision: decimal precision
     """
     def draw_uniform(self, a, b, precision=2):
-        values = []
-        for i in range(self.num_type):
-            values.append(round(random.uniform(a, b), precision))
-        values.sort()
-        return values
+        return np.sort(np.round(self.rng.uniform(a, b, self.num_type), precision))
 
     """
     Generate values uniformly distributed in (a, b)
     """
+    @cached
     def value_uniform(self, a, b):
-        values = []
-        for i in range(self.num_type):
-            values.append((i + 1) * (b - a) / (self.num_type + 1) + a)
-        return values
+        return (np.arange(1, self.num_type + 1) * (b - a) / (self.num_type + 1) + a).astype(np.float64)
 
     """
     Generate values according to (discrete) exponential distribution
     :param scale: 1 / lambda in pdf lambda * e ^ (- lambda * x)
     """
+    @cached
     def value_exponential(self, scale=1):
-        values = []
-        cdf = 0
-        for i in range(self.num_type):
-            cdf += 1 / (self.num_type + 1)
-            values.append(expon.ppf(cdf, scale=scale))
-        return values
+        cdf = np.cumsum(np.full(self.num_type, 1 / (self.num_type + 1)))
+        return expon.ppf(cdf, scale=scale)
 
     """
     Generate values according to (discrete) mixture Kumaraswamy distribution
-    The CDF of the mixture distribution is q*(1-(1-x)^a)^b + (1-q)*(1-(1-x)^c)^d
+    The CDF of the mixture distribution is q*(1-(1-x)^a)^b + (1-q)*(1-(1-x)^c)^d, inverted by kumaraswamy_ppf
     """
+    @cached
     def value_kumaraswamy(self, a, b, c, d, q, precision=4):
-        values = []
-        cdf = 0
-        for i in range(self.num_type):
-            cdf += 1 / (self.num_type + 1)
-
-            # cdf = q * F(x) + (1-q) * G(x)
-            def func(x):
-                return q * (1 - (1-x**a)**b) + (1-q) * (1 - (1-x**c)**d) - cdf
-            v = fsolve(func, 1e-4)[0]
-            values.append(round(v.item(), precision))
-        return values
+        cdfs = np.cumsum(np.full(self.num_type, 1 / (self.num_type + 1)))
+        return np.round(kumaraswamy_ppf(cdfs, a, b, c, d, q), precision)
 
     """
     Add a perturbation to vs or vm or vt, draw uniformly from (a, b)
     """
     def perturbation(self, a, b, vs=True, vm=True, vt=True, precision=4):
         if vs:
-            for i in range(len(self.vsList)):
-                off = round(random.uniform(a, b), precision)
-                self.vsList[i] += off
+            self.vs = self.vs + np.round(self.rng.uniform(a, b, len(self.vs)), precision)
         if vm:
-            for i in range(len(self.vmList)):
-                off = round(random.uniform(a, b), precision)
-                self.vmList[i] += off
+            self.vm = self.vm + np.round(self.rng.uniform(a, b, len(self.vm)), precision)
         if vt:
-            for i in range(len(self.vtList)):
-                off = round(random.uniform(a, b), precision)
-                self.vtList[i] += off
+            self.vt = self.vt + np.round(self.rng.uniform(a, b, len(self.vt)), precision)
 
     """
     Generate a uniform type distribution
     """
     # TODO: Can we generate values using this pdf and cdf? We don't want end points for values
     def type_uniform(self):
-        cdf = 0
-        for i in range(self.num_type):
-            pdf = 1 / self.num_type
-            # cdf += pdf  # include right end point
-            cdf = (i+1) / (self.num_type + 1)  # exclude both end points
-            self.pdfList.append(pdf)
-            self.cdfList.append(cdf)
+        self.pdf, self.cdf = self.dist_uniform()
+
+    @cached
+    def dist_uniform(self):
+        pdf = np.full(self.num_type, 1 / self.num_type)
+        # cdf = np.cumsum(pdf)  # include right end point
+        cdf = np.arange(1, self.num_type + 1) / (self.num_type + 1)  # exclude both end points
+        return pdf, cdf
 
     """
     Generate a type distribution according to a mixture of two Kumaraswamy distributions,
@@ -122,19 +294,14 @@ class Population:
     The PMF is q * abx^(a-1) * (1-x^a)^(b-1) + (1-q) * cdx^(c-1) * (1-x^c)^(d-1)
     """
     def type_kumaraswamy(self, a, b, c, d, q, precision=4):
-        total = 0
-        cdf = 0
-        temp = []
-        for i in range(self.num_type):
-            x = (i+1) / (self.num_type + 1)
-            pmf = q * a*b*x**(a-1) * (1-x**a)**(b-1) + (1 - q) * c*d*x**(c-1) * (1-x**c)**(d-1)
-            temp.append(pmf)
-            total += pmf
-        for i in range(self.num_type):
-            pmf = round(temp[i] / total, precision)
-            cdf += pmf
-            self.pdfList.append(pmf)
-            self.cdfList.append(cdf)
+        self.pdf, self.cdf = self.dist_kumaraswamy(a, b, c, d, q, precision)
+
+    @cached
+    def dist_kumaraswamy(self, a, b, c, d, q, precision=4):
+        x = np.arange(1, self.num_type + 1) / (self.num_type + 1)
+        pmf = q * a*b*x**(a-1) * (1-x**a)**(b-1) + (1 - q) * c*d*x**(c-1) * (1-x**c)**(d-1)
+        pdf = np.round(pmf / pmf.sum(), precision)
+        return pdf, np.cumsum(pdf)
 
     def type_equal_revenue(self, precision=4):
         total = 0
@@ -148,76 +315,118 @@ class Population:
     Calculate list of vs/vm, vt/vm, and vs/vt
     """
     def calculate_ratio(self):
-        for i in range(self.num_type):
-            self.smList.append(self.vsList[i] / self.vmList[i])
-            self.tmList.append(self.vtList[i] / self.vmList[i])
-            self.stList.append(self.vsList[i] / self.vtList[i])
+        self.sm = self.vs / self.vm
+        self.tm = self.vt / self.vm
+        self.st = self.vs / self.vt
+
+    """
+    Discrete virtual value of a value array, i.e. v_i - (1-F(v_i)) / f(v_i) * (v_{i+1} - v_i),
+    with the last type keeping its own value
+    """
+    def virtual(self, values):
+        vir = values.copy()
+        vir[:-1] -= (1 - self.cdf[:-1]) / self.pdf[:-1] * np.diff(values)
+        return vir
 
     """
     Calculate virtual value for vs, i.e. v_i - (1-F(v_i)) / f(v_i) * (v_{i+1} - v_i)
     """
     def calculate_virtual_s(self):
-        for i in range(self.num_type - 1):
-            self.vir_vsList.append(self.vsList[i] - (1 - self.cdfList[i]) / self.pdfList[i]
-                                   * (self.vsList[i+1] - self.vsList[i]))
-        self.vir_vsList.append(self.vsList[-1])  # last type
+        self.vir_vs = self.virtual(self.vs)
 
     """
     Calculate virtual value for vs/vm
     """
     def calculate_virtual_sm(self):
-        for i in range(self.num_type - 1):
-            self.vir_smList.append(self.smList[i] - (1 - self.cdfList[i]) / self.pdfList[i]
-                                   * (self.smList[i + 1] - self.smList[i]))
-        self.vir_smList.append(self.smList[-1])  # last type
+        self.vir_sm = self.virtual(self.sm)
 
     """
     Calculate virtual value for vs/vt
     """
     def calculate_virtual_st(self):
-        for i in range(self.num_type - 1):
-            self.vir_stList.append(self.stList[i] - (1 - self.cdfList[i]) / self.pdfList[i]
-                                   * (self.stList[i + 1] - self.stList[i]))
-        self.vir_stList.append(self.stList[-1])  # last type
+        self.vir_st = self.virtual(self.st)
+
+    """
+    Iron the discrete virtual values of a value array, i.e. replace them on each interval where they decrease
+    by their pdf-weighted average, the slopes of the convex hull of the revenue curve. Linear time.
+    :param values: values of the types, e.g. vs
+    :return: ironed virtual values, and the pooling intervals as a list of (first, last) types, 0-indexed
+    """
+    def iron(self, values):
+        # virtual values times pdf, without dividing by the pdf
+        totals = values * self.pdf
+        totals[:-1] -= (1 - self.cdf[:-1]) * np.diff(values)
+        ironed, start = pool(totals, self.pdf)
+        intervals = [(a, b - 1) for a, b in zip(start[:-1].tolist(), start[1:].tolist()) if b - a > 1]
+        return ironed, intervals
+
+    """
+    Calculate ironed virtual value and pooling intervals for vs
+    """
+    def calculate_ironed_s(self):
+        self.iron_vs, self.pooled_vs = self.iron(self.vs)
+
+    """
+    Calculate ironed virtual value and pooling intervals for vs/vm
+    """
+    def calculate_ironed_sm(self):
+        self.iron_sm, self.pooled_sm = self.iron(self.sm)
+
+    """
+    Calculate ironed virtual value and pooling intervals for vs/vt
+    """
+    def calculate_ironed_st(self):
+        self.iron_st, self.pooled_st = self.iron(self.st)
 
     """
     Calculate the hazard rate: f(v) / (1 - F(v))
     """
     def calculate_hazard_rate(self):
-        for i in range(self.num_type - 1):
-            self.h_rate.append(self.pdfList[i] / (1-self.cdfList[i]))
-        self.h_rate.append(self.pdfList[-1])
+        self.hr = self.pdf.copy()
+        self.hr[:-1] /= 1 - self.cdf[:-1]
 
     """
     Calculate the reciprocal of the hazard rate: (1-F(v_i)) / f(v_i) * (v_{i+1} - v_i)
     """
     def calculate_rec_hr_st(self):
-        for i in range(self.num_type - 1):
-            self.rec_hr_st.append((1 - self.cdfList[i]) / self.pdfList[i]
-                                  * (self.stList[i+1] - self.stList[i]))
-        self.rec_hr_st.append(0)
+        self.rec_hr = np.zeros(self.num_type)
+        self.rec_hr[:-1] = (1 - self.cdf[:-1]) / self.pdf[:-1] * np.diff(self.st)
 
     """
     Check if the distribution of vs satisfies monotone regularity constraint
     """
     def regular_s(self):
-        for i in range(self.num_type - 1):
-            if self.vir_vsList[i] > self.vir_vsList[i+1]:
-                return False
-        return True
+        return bool(np.all(self.vir_vs[:-1] <= self.vir_vs[1:]))
+
+    """
+    Check if the types are single crossing, so that adjacent IC constraints imply all IC constraints.
+    Dividing the utility by vm, a type is (vs/vm, vt/vm). Ordered by vs/vm, the types are single crossing
+    when vs/vm is strictly increasing and vt/vm is affine in vs/vm, i.e. the types differ along one line.
+    In the Myerson environment, the types are single crossing when vs is strictly increasing.
+    :param tol: tolerance on the distance of vt/vm to the line
+    :return: order of types along the line if single crossing, otherwise None
+    """
+    def single_crossing(self, myerson=False, tol=1e-9):
+        key = self.vs if myerson else self.sm
+        order = np.argsort(key, kind="stable")
+        if np.any(np.diff(key[order]) <= 0):
+            return None
+        if not myerson and self.num_type > 2:
+            sm = self.sm[order]
+            tm = self.tm[order]
+            line = tm[0] + (tm[-1] - tm[0]) / (sm[-1] - sm[0]) * (sm - sm[0])
+            if np.max(np.abs(tm - line)) > tol * max(1, np.max(np.abs(tm))):
+                return None
+        return order
 
     """
     clear value lists
     """
     def clear_values(self):
-        self.vsList.clear()
-        self.vmList.clear()
-        self.vtList.clear()
-        self.pdfList.clear()
-        self.cdfList.clear()
-        self.smList.clear()
-        self.tmList.clear()
-        self.stList.clear()
-        self.vir_vsList.clear()
-        self.vir_smList.clear()
-
+        for attr in ("vs", "vm", "vt", "pdf", "cdf", "sm", "tm", "st",
+                     "vir_vs", "vir_sm", "vir_st", "iron_vs", "iron_sm", "iron_st", "hr", "rec_hr"):
+            setattr(self, attr, np.empty(0))
+        # pooling intervals of the ironed virtual values
+        self.pooled_vs = []
+        self.pooled_sm = []
+        self.pooled_st = []
@@ -0,0 +1,228 @@
+"""
+Module for conditions on solved instances, e.g. the counterexample conditions of counter_finder
+A Predicate is a function of a Solution (see solution.py) and a population returning a bool, vectorized
+over the types. Predicates compose with & (and), | (or) and ~ (not), and parse from expressions such as
+"not mono(x, sm) and regular(vs)", so that a condition can be given on the command line.
+Each predicate also has a margin, a number >= 0 where it holds and < 0 where it fails, measuring how far the
+instance is from changing it: and takes the minimum of the margins, or the maximum, not the negation (a
+margin of exactly 0 holds, so its negation is the smallest negative number instead of 0).
+Guided searches (see counter_finder.py) climb the margin of the counterexample condition.
+
+Built-in predicates (types and pairs 1-indexed, from 1 to n, a pair of two different types):
+mono(var, key[, decreasing]): var (x, p or w) is monotone non-decreasing (non-increasing) in key (vs, vm, vt,
+    sm = vs/vm, tm = vt/vm or st = vs/vt)
+zero(dual, i[, j]) / nonzero(dual, i[, j]): the dual value ic[i, j], ir[i], bound[i] or supply is (non)zero
+tight(constraint, i[, j]): the constraint IC(i, j), IR(i) or supply is tight
+regular(values): the virtual values of values (vs, sm or st) are non-decreasing
+
+Zejian Huang
+"""
+
+import ast
+
+import numpy as np
+
+
+class Predicate:
+    """
+    :param func: function of (solution, pop) returning a bool
+    :param name: expression of the predicate, e.g. "mono(x, sm)"
+    :param margin: function of (solution, pop) returning the margin, >= 0 if and only if func is true
+    """
+    def __init__(self, func, name, margin):
+        self.func = func
+        self.name = name
+        self.margin = margin
+
+    def __call__(self, solution, pop):
+        return bool(self.func(solution, pop))
+
+    def __and__(self, other):
+        return Predicate(lambda s, pop: self(s, pop) and other(s, pop), "(%s and %s)" % (self.name, other.name),
+                         lambda s, pop: min(self.margin(s, pop), other.margin(s, pop)))
+
+    def __or__(self, other):
+        return Predicate(lambda s, pop: self(s, pop) or other(s, pop), "(%s or %s)" % (self.name, other.name),
+                         lambda s, pop: max(self.margin(s, pop), other.margin(s, pop)))
+
+    def __invert__(self):
+        return Predicate(lambda s, pop: not self(s, pop), "not " + self.name,
+                         lambda s, pop: negate(self.margin(s, pop)))
+
+    def __repr__(self):
+        return self.name
+
+
+"""
+Margin of the negation of a predicate of a margin: -margin, negative where the margin is 0, which holds
+"""
+def negate(margin):
+    return -margin if margin != 0 else -np.finfo(np.float64).tiny
+
+
+"""
+Check whether values are monotone in keys in O(n log n): no type has a smaller value than a type with a smaller key
+Keys within tol of each other are equal, and values within tol of each other are not ordered.
+"""
+def is_monotone(values, keys, decreasing=False, tol=1e-8):
+    return monotone_margin(values, keys, decreasing, tol) >= 0
+
+
+"""
+Margin of monotonicity: tol plus the smallest difference between the value of a type and the largest value of
+the types with smaller keys, i.e. minus the largest violation, inf for a single group of equal keys
+"""
+def monotone_margin(values, keys, decreasing=False, tol=1e-8):
+    if decreasing:
+        values = -values
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = values[order]
+    # first type of each group of equal keys
+    start = np.r_[0, np.flatnonzero(np.diff(keys) > tol) + 1]
+    group = np.repeat(np.arange(len(start)), np.diff(np.r_[start, len(keys)]))
+    # largest value of the types with smaller keys
+    below = np.r_[-np.inf, np.maximum.accumulate(values)[start[1:] - 1]]
+    return float(np.min(values - below[group])) + tol
+
+
+def mono(var, key, decreasing=False, tol=1e-8):
+    if var not in ("x", "p", "w"):
+        raise ValueError("unknown variable: " + str(var))
+    if key not in ("vs", "vm", "vt", "sm", "tm", "st"):
+        raise ValueError("unknown key: " + str(key))
+    return Predicate(lambda s, pop: is_monotone(getattr(s, var), getattr(pop, key), decreasing, tol),
+                     "mono(%s, %s%s)" % (var, key, ", decreasing" if decreasing else ""),
+                     lambda s, pop: monotone_margin(getattr(s, var), getattr(pop, key), decreasing, tol))
+
+
+"""
+Mask entry of a dual value or constraint by name and 1-indexed position
+:param text: expression of the predicate, for errors
+:param n: number of types, positions are only checked against it when the predicate is evaluated if None
+"""
+def index(name, i=None, j=None, text="", n=None):
+    if name == "ic" and j is not None:
+        positions = (i, j)
+    elif name in ("ir", "bound") and i is not None and j is None:
+        positions = (i,)
+    elif name == "supply" and i is None:
+        return ()
+    else:
+        raise ValueError("bad index of %s in %s" % (name, text))
+    for a in positions:
+        if not isinstance(a, int) or isinstance(a, bool) or a < 1 or (n is not None and a > n):
+            raise ValueError("type %r not in 1..%s in %s" % (a, "n" if n is None else n, text))
+    if len(positions) == 2 and i == j:
+        raise ValueError("no IC constraint of a type with itself in %s" % text)
+    return tuple(a - 1 for a in positions) if len(positions) == 2 else i - 1
+
+
+"""
+Check that the types of a mask entry exist in a solution
+"""
+def check(solution, k, text):
+    n = len(solution.tight_ir) if solution.slack_ir is not None else len(solution.dual.ir)
+    if max(np.atleast_1d(k), default=0) >= n:
+        raise ValueError("type not in 1..%d in %s" % (n, text))
+
+
+"""
+Slack of the primal constraint of a dual value, inf if unknown (e.g. an IC constraint not in the model)
+By complementary slackness a dual value is nonzero only if its constraint is tight, so the slack measures how
+far a zero dual value is from becoming nonzero.
+"""
+def primal_slack(solution, dual, k, text=""):
+    check(solution, k, text)
+    if dual == "bound":
+        slack = 1 - solution.x[k]
+    elif dual == "supply":
+        slack = solution.slack_supply
+    else:
+        slack = getattr(solution, "slack_" + dual)[k]
+    slack = abs(slack)
+    return np.inf if np.isnan(slack) else slack
+
+
+def dual_value(solution, dual, k, text=""):
+    check(solution, k, text)
+    return abs(np.asarray(getattr(solution.dual, dual))[k])
+
+
+"""
+Margin of a nonzero dual value: its size if nonzero, otherwise minus the slack of its constraint, less tol
+"""
+def nonzero_margin(solution, dual, k, text=""):
+    return dual_value(solution, dual, k, text) - primal_slack(solution, dual, k, text) - solution.tol
+
+
+def zero(dual, i=None, j=None, n=None):
+    name = "zero(%s)" % signature(dual, i, j)
+    k = index(dual, i, j, name, n)
+    return Predicate(lambda s, pop: dual_value(s, dual, k, name) <= s.tol, name,
+                     lambda s, pop: -nonzero_margin(s, dual, k, name))
+
+
+def nonzero(dual, i=None, j=None, n=None):
+    name = "nonzero(%s)" % signature(dual, i, j)
+    k = index(dual, i, j, name, n)
+    return Predicate(lambda s, pop: dual_value(s, dual, k, name) > s.tol, name,
+                     lambda s, pop: nonzero_margin(s, dual, k, name))
+
+
+def tight(constraint, i=None, j=None, n=None):
+    name = "tight(%s)" % signature(constraint, i, j)
+    k = index(constraint, i, j, name, n)
+    return Predicate(lambda s, pop: primal_slack(s, constraint, k, name) <= s.tol, name,
+                     lambda s, pop: s.tol - primal_slack(s, constraint, k, name))
+
+
+def regular(values="vs", tol=1e-8):
+    if values not in ("vs", "sm", "st"):
+        raise ValueError("unknown values: " + str(values))
+    return Predicate(lambda s, pop: np.all(np.diff(getattr(pop, "vir_" + values)) >= -tol), "regular(%s)" % values,
+                     lambda s, pop: float(np.min(np.diff(getattr(pop, "vir_" + values)), initial=np.inf)) + tol)
+
+
+def signature(name, i=None, j=None):
+    return ", ".join(str(a) for a in (name, i, j) if a is not None)
+
+
+PREDICATES = {"mono": mono, "zero": zero, "nonzero": nonzero, "tight": tight, "regular": regular}
+# predicates with positions of types, checked against the number of types given to parse
+INDEXED = ("zero", "nonzero", "tight")
+
+
+"""
+Parse an expression of built-in predicates combined with and, or, not and parentheses
+Bare names are strings and numbers are constants, e.g. "nonzero(ic, 1, 4) or not mono(x, sm)".
+:param n: number of types, to reject positions of types out of range, e.g. "nonzero(ic, 10, 11)" with n = 9
+"""
+def parse(expression, n=None):
+    return build(ast.parse(expression, mode="eval").body, n)
+
+
+def build(node, n=None):
+    if isinstance(node, ast.BoolOp):
+        predicates = [build(v, n) for v in node.values]
+        result = predicates[0]
+        for p in predicates[1:]:
+            result = result & p if isinstance(node.op, ast.And) else result | p
+        return result
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return ~build(node.operand, n)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in PREDICATES:
+        args = [argument(a) for a in node.args]
+        kwargs = {k.arg: argument(k.value) for k in node.keywords}
+        if node.func.id in INDEXED:
+            kwargs["n"] = n
+        return PREDICATES[node.func.id](*args, **kwargs)
+    raise ValueError("unsupported expression: " + ast.unparse(node))
+
+
+def argument(node):
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Constant):
+        return node.value
+    raise ValueError("unsupported argument: " + ast.unparse(node))
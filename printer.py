@@ -1,160 +1,102 @@
+import numpy as np
 from prettytable import PrettyTable
 import matplotlib.pyplot as plt
 
 """
 Print primal solution and constraints
+:param solution: a Solution, see solution.py
 :param myerson: indicate whether the problem is in Myerson's environment
+:param max_matrix_n: largest n whose tight IC constraints are printed as an n * n matrix, larger n list the
+    tight IC constraints of each type instead
 """
-def print_solution(model, pop, q, precision, myerson=False):
-    print('Primal: q: %.2f, Obj: %g' % (q, model.objVal))
-    solution = model.getVars()
+def print_solution(solution, pop, q, precision, myerson=False, max_matrix_n=100):
+    print('Primal: q: %.2f, Obj: %g' % (q, solution.objVal))
     n = pop.num_type
 
     # Columns
     if myerson:
         t = PrettyTable(["index", "prob", "vs", "x", "p", "vs_vir"])
+        columns = [pop.pdf, pop.vs, solution.x, solution.p, pop.vir_vs]
     else:
         t = PrettyTable(["index", "prob", "vs", "vm", "vt", "x", "p", "w", "vs/vm", "vs/vt", "vt/vm",
                         "vir_vs", "vir_vs/vm", "vir_vs/vt", "rec_hr_st"])
+        columns = [pop.pdf, pop.vs, pop.vm, pop.vt, solution.x, solution.p, solution.w, pop.sm, pop.st, pop.tm,
+                   pop.vir_vs, pop.vir_sm, pop.vir_st, pop.rec_hr]
 
     # Solutions
-    if myerson:
-        for i in range(n):
-            x = round(solution[i].x, precision)
-            p = round(solution[n + i].x, precision)
-            t.add_row([i + 1, round(pop.pdfList[i], precision),
-                       round(pop.vsList[i], precision),
-                       x, p,
-                       round(pop.vir_vsList[i], precision)])
-    else:
-        for i in range(n):
-            x = round(solution[i].x, precision)
-            p = round(solution[n + i].x, precision)
-            w = round(solution[2 * n + i].x, precision)
-            t.add_row([i + 1, round(pop.pdfList[i], precision),
-                       round(pop.vsList[i], precision),
-                       round(pop.vmList[i], precision),
-                       round(pop.vtList[i], precision),
-                       x, p, w,
-                       round(pop.smList[i], precision),
-                       round(pop.stList[i], precision),
-                       round(pop.tmList[i], precision),
-                       round(pop.vir_vsList[i], precision),
-                       round(pop.vir_smList[i], precision),
-                       round(pop.vir_stList[i], precision),
-                       round(pop.rec_hr_st[i], precision)])
+    for i, row in enumerate(np.round(np.column_stack(columns), precision).tolist()):
+        t.add_row([i + 1] + row)
     print(t)
 
     # Constraints
-    # Find tight constraints
-    slack = model.getAttr("slack")
-    index = 0
-    header = ["constraint"]
-    for i in range(n):
-        header.append(str(i + 1))
-    t2 = PrettyTable(header)
-    for i in range(n):
+    # Tight constraints
+    if n > max_matrix_n:
+        t2 = PrettyTable(["type", "IR", "tight IC(type, c) for c in"])
+        for i, (ir, tight) in enumerate(zip(solution.tight_ir.tolist(), solution.tight_ic)):
+            t2.add_row([i + 1, "u({i})=0".format(i=i + 1) if ir else "____>0",
+                        " ".join(str(j + 1) for j in np.flatnonzero(tight).tolist())])
+        print(t2)
+        return
+    t2 = PrettyTable(["constraint"] + [str(i + 1) for i in range(n)])
+    for i, tight in enumerate(solution.tight_ic.tolist()):
         row = ["IC(" + str(i + 1) + ", c)"]
-        for j in range(n):
+        for j, tight_ij in enumerate(tight):
             if i == j:
                 row.append("****")
-            elif slack[index] == 0:
-                row.append("u({i},{i})=u({i},{j})".format(i=i + 1, j=len(row)))
-                index += 1
+            elif tight_ij:
+                row.append("u({i},{i})=u({i},{j})".format(i=i + 1, j=j + 1))
             else:
                 row.append("___>___")
-                index += 1
         t2.add_row(row)
-    row = ["IR"]
-    for i in range(n):
-        if slack[index] == 0:
-            row.append("u({i})=0".format(i=i + 1))
-            index += 1
-        else:
-            row.append("____>0")
-            index += 1
-    t2.add_row(row)
+    t2.add_row(["IR"] + ["u({i})=0".format(i=i + 1) if tight else "____>0"
+                         for i, tight in enumerate(solution.tight_ir.tolist())])
     print(t2)
 
 
 """
 Print dual solution
+:param solution: a Solution with dual values, see solution.py
 :param myerson: indicate whether the problem is in Myerson's environment
+:param max_matrix_n: largest n whose dual values of IC are printed as an n * n matrix, larger n list the nonzero
+    ones of each type instead, with one row per type for the other dual values and the tight dual constraints
 """
-def print_dual_solution(model, pop, q, precision, myerson=False):
-    print('Dual: q: %.2f, Obj: %g' % (q, model.objVal))
+def print_dual_solution(solution, pop, q, precision, myerson=False, max_matrix_n=100):
+    d = solution.dual
+    print('Dual: q: %.2f, Obj: %g' % (q, d.objVal))
     n = pop.num_type
+    names = ["x", "p"] if myerson else ["x", "p", "w"]
+    if n > max_matrix_n:
+        print("Supply: " + str(round(float(d.supply), precision)))
+        t = PrettyTable(["type", "IR", "Bound"] + names + ["nonzero IC(type, c) for c: value"])
+        ic = np.round(d.ic, precision)
+        tight = np.split(solution.tight_dual[:len(names) * n], len(names))
+        columns = [np.round(d.ir, precision).tolist(), np.round(d.bound, precision).tolist()]
+        columns += [["tight" if v else "_____" for v in mask.tolist()] for mask in tight]
+        for i, row in enumerate(zip(*columns)):
+            nonzero = np.flatnonzero(~solution.zero_ic[i]).tolist()
+            t.add_row([i + 1] + list(row) + [" ".join("%d: %s" % (j + 1, ic[i, j]) for j in nonzero)])
+        print(t)
+        return
+    header = ["var"] + [str(i + 1) for i in range(n)]
 
     # Solutions
-    header = ["var"]
-    for i in range(n):
-        header.append(str(i + 1))
     t = PrettyTable(header)
     # print IC
-    for i in range(n):
-        row = ["IC(" + str(i + 1) + ", c)"]
-        for j in range(n):
-            if i == j:
-                row.append("")
-            else:
-                name = "ic[" + str(i) + "," + str(j) + "]"
-                row.append(round(model.getVarByName(name).x, precision))
-        t.add_row(row)
+    for i, values in enumerate(np.round(d.ic, precision).tolist()):
+        values[i] = ""
+        t.add_row(["IC(" + str(i + 1) + ", c)"] + values)
     # print IR
-    row = ["IR"]
-    for i in range(n):
-        row.append(round(model.getVarByName("ir[" + str(i) + "]").x, precision))
-    t.add_row(row)
+    t.add_row(["IR"] + np.round(d.ir, precision).tolist())
     # print bound
-    row = ["Bound"]
-    for i in range(n):
-        row.append(round(model.getVarByName("bound[" + str(i) + "]").x, precision))
-    t.add_row(row)
+    t.add_row(["Bound"] + np.round(d.bound, precision).tolist())
     # print supply
-    row = ["Supply", round(model.getVarByName("supply").x, precision)]
-    for i in range(n - 1):
-        row.append("")
-    t.add_row(row)
+    t.add_row(["Supply", round(float(d.supply), precision)] + [""] * (n - 1))
     print(t)
 
     # tight / slack constraints
-    slack = model.getAttr("slack")
-    header2 = ["constraint"]
-    for i in range(n):
-        header2.append(str(i + 1))
-    t2 = PrettyTable(header2)
-    index = 0
-    # x
-    row = ["x"]
-    for i in range(n):
-        if slack[index] == 0:
-            row.append("tight")
-            index += 1
-        else:
-            row.append("_____")
-            index += 1
-    t2.add_row(row)
-    # p
-    row = ["p"]
-    for i in range(n):
-        if slack[index] == 0:
-            row.append("tight")
-            index += 1
-        else:
-            row.append("_____")
-            index += 1
-    t2.add_row(row)
-    # w
-    if not myerson:
-        row = ["w"]
-        for i in range(n):
-            if slack[index] == 0:
-                row.append("tight")
-                index += 1
-            else:
-                row.append("_____")
-                index += 1
-        t2.add_row(row)
+    t2 = PrettyTable(["constraint"] + header[1:])
+    for name, tight in zip(names, np.split(solution.tight_dual[:len(names) * n], len(names))):
+        t2.add_row([name] + ["tight" if v else "_____" for v in tight.tolist()])
     print(t2)
 
 
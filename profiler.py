@@ -0,0 +1,149 @@
+"""
+Module for profiling the stages of a run
+A Profiler records named timing spans (with profiler.span("build"): ...) and the statistics of solved LPs
+(solver runtime, iterations, rows, columns, nonzeros), aggregates them per run with percentiles, and exports
+them as JSON, or the whole run as a cProfile dump. A disabled Profiler returns a shared no-op span,
+so the instrumentation can stay in the scripts.
+
+Zejian Huang
+"""
+
+import contextlib
+import cProfile
+import json
+import time
+
+import numpy as np
+from prettytable import PrettyTable
+
+NULL_SPAN = contextlib.nullcontext()
+PERCENTILES = [50, 90, 99]
+
+
+class Span:
+    """
+    Timing span, adding its wall time to the profiler on exit
+    """
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.spans.setdefault(self.name, []).append(time.perf_counter() - self.start)
+
+
+class Profiler:
+    """
+    :param enabled: record spans and statistics, otherwise span and solver do nothing
+    :param cprofile: also run cProfile from now on, see dump_stats
+    """
+    def __init__(self, enabled=True, cprofile=False):
+        self.enabled = enabled
+        self.spans = {}  # name: list of seconds
+        self.stats = {}  # name: {statistic: list of values}
+        self.profile = None
+        if enabled and cprofile:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    """
+    Timing span of a stage, to be used in a with statement
+    """
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    """
+    Record the statistics of a solved LP of a backend, see backend.py
+    """
+    def solver(self, name, lp):
+        if not self.enabled:
+            return
+        stats = self.stats.setdefault(name, {})
+        for key, value in lp.stats().items():
+            stats.setdefault(key, []).append(value)
+
+    """
+    Add the spans and statistics of another profiler, e.g. of a worker process, given by its raw() data
+    """
+    def merge(self, raw):
+        for name, seconds in raw["spans"].items():
+            self.spans.setdefault(name, []).extend(seconds)
+        for name, stats in raw["stats"].items():
+            for key, values in stats.items():
+                self.stats.setdefault(name, {}).setdefault(key, []).extend(values)
+
+    """
+    Recorded spans and statistics, plain lists to be sent between processes
+    """
+    def raw(self):
+        return {"spans": self.spans, "stats": self.stats}
+
+    """
+    Aggregates of the spans (seconds) and statistics
+    :return: {"spans": {name: aggregates}, "stats": {name: {statistic: aggregates}}},
+        aggregates being count, total, mean, max and the percentiles p50, p90, p99
+    """
+    def summary(self):
+        return {"spans": {name: aggregate(values) for name, values in self.spans.items()},
+                "stats": {name: {key: aggregate(values) for key, values in stats.items()}
+                          for name, stats in self.stats.items()}}
+
+    def to_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.summary(), file, indent=1)
+
+    """
+    Stop cProfile and write its statistics, to be read by pstats or snakeviz
+    """
+    def dump_stats(self, path):
+        if self.profile is None:
+            raise ValueError("the profiler was not created with cprofile=True")
+        self.profile.disable()
+        self.profile.dump_stats(path)
+
+    """
+    Print the summary and, if enabled, write it to path: a cProfile dump if path ends with .prof, JSON otherwise
+    """
+    def report(self, path=None):
+        if not self.enabled:
+            return
+        self.print_summary()
+        if path is not None and path.endswith(".prof"):
+            self.dump_stats(path)
+        elif path is not None:
+            self.to_json(path)
+
+    def print_summary(self):
+        summary = self.summary()
+        total = sum(s["total"] for s in summary["spans"].values())
+        t = PrettyTable(["span", "count", "total (s)", "share", "mean (s)", "p50 (s)", "p90 (s)", "p99 (s)",
+                         "max (s)"])
+        for name, s in summary["spans"].items():
+            t.add_row([name, s["count"], "%.4g" % s["total"], "%.1f%%" % (100 * s["total"] / max(total, 1e-300))]
+                      + ["%.3g" % s[key] for key in ("mean", "p50", "p90", "p99", "max")])
+        print(t)
+        if summary["stats"]:
+            t = PrettyTable(["solver", "statistic", "total", "mean", "p50", "p90", "p99", "max"])
+            for name, stats in summary["stats"].items():
+                for key, s in stats.items():
+                    t.add_row([name, key] + ["%.4g" % s[k] for k in ("total", "mean", "p50", "p90", "p99", "max")])
+            print(t)
+
+
+"""
+Count, total, mean, max and percentiles of a list of values
+"""
+def aggregate(values):
+    values = np.asarray(values, dtype=np.float64)
+    result = {"count": len(values), "total": float(values.sum()), "mean": float(values.mean()),
+              "max": float(values.max())}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        result["p" + str(p)] = float(value)
+    return result
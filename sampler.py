@@ -0,0 +1,112 @@
+"""
+Module for drawing batches of perturbation vectors from a box
+A Sampler draws whole blocks of points in the unit cube, independent uniform ("random"), from a scrambled
+Sobol sequence ("sobol") or Latin hypercubes ("lhs", see scipy.stats.qmc), and scales them to (a, b) on the
+grid of a precision. Sobol and Latin hypercube points fill the box more evenly than independent draws for the
+same number of points, so a search covers the perturbations better for the same number of LP solves.
+The first max_points points handed out are kept, as applied (on the grid), to measure their coverage by the
+centered L2 discrepancy (lower is more even), reported next to the discrepancy of as many independent uniform
+points on the same grid.
+
+Zejian Huang
+"""
+
+import numpy as np
+from scipy.stats import qmc
+
+METHODS = ("random", "sobol", "lhs")
+
+
+class Sampler:
+    """
+    :param dim: dimension of the points, e.g. 3 * n for perturbations of vs, vm, vt
+    :param method: "random", "sobol" or "lhs"
+    :param rng: random generator, or a seed of one
+    :param block: points drawn at once; a power of 2 keeps the balance of Sobol points, and each block of
+        "lhs" is a Latin hypercube
+    :param max_points: points kept for the discrepancy, which takes O(max_points ** 2 * dim)
+    """
+    def __init__(self, dim, method="sobol", rng=None, block=256, max_points=4096):
+        if method not in METHODS:
+            raise ValueError("unknown method: " + str(method))
+        self.dim = dim
+        self.method = method
+        self.rng = np.random.default_rng(rng)
+        self.block = block
+        if method == "sobol":
+            self.engine = qmc.Sobol(dim, rng=self.rng)
+        elif method == "lhs":
+            self.engine = qmc.LatinHypercube(dim, rng=self.rng)
+        else:
+            self.engine = None
+        self.points = np.empty((max_points, dim))  # first points handed out, scaled back to the unit cube
+        self.drawn = 0  # number of points handed out
+        self.pending = np.empty((0, dim))  # rest of the last block of draw
+        self.box = None  # (a, b, precision) of the last points handed out
+
+    """
+    Points in the unit cube
+    :param num: number of points
+    :return: num * dim array
+    """
+    def unit(self, num):
+        if self.engine is None:
+            return self.rng.random((num, self.dim))
+        return self.engine.random(num)
+
+    """
+    Scale points of the unit cube to (a, b), rounded to precision, keeping them while there is room
+    """
+    def apply(self, points, a, b, precision):
+        offsets = np.round(a + (b - a) * points, precision)
+        kept = min(len(points), len(self.points) - self.drawn)
+        if kept > 0:
+            self.points[self.drawn:self.drawn + kept] = (offsets[:kept] - a) / (b - a)
+        self.drawn += len(points)
+        self.box = (a, b, precision)
+        return offsets
+
+    """
+    A batch of points in (a, b), rounded to precision
+    :return: num * dim array
+    """
+    def batch(self, num, a, b, precision=4):
+        return self.apply(self.unit(num), a, b, precision)
+
+    """
+    One point in (a, b), rounded to precision, taken from a block drawn at once
+    """
+    def draw(self, a, b, precision=4):
+        if len(self.pending) == 0:
+            self.pending = self.unit(self.block)
+        point = self.pending[:1]
+        self.pending = self.pending[1:]
+        return self.apply(point, a, b, precision)[0]
+
+    def count(self):
+        return self.drawn
+
+    """
+    Centered L2 discrepancy of the first points handed out, as applied, i.e. rounded to the grid
+    :return: discrepancy, nan if fewer than 2 points
+    """
+    def discrepancy(self):
+        num = min(self.drawn, len(self.points))
+        if num < 2:
+            return np.nan
+        return float(qmc.discrepancy(np.clip(self.points[:num], 0, 1)))
+
+
+"""
+Centered L2 discrepancy of num independent uniform points in dim dimensions, a baseline of Sampler.discrepancy
+:param box: (a, b, precision) of the grid the points are rounded to, None for none
+"""
+def uniform_discrepancy(num, dim, box=None, max_points=4096, seed=0):
+    num = min(num, max_points)
+    if num < 2:
+        return np.nan
+    points = np.random.default_rng(seed).random((num, dim))
+    if box is not None:
+        a, b, precision = box
+        points = (np.round(a + (b - a) * points, precision) - a) / (b - a)
+    return float(qmc.discrepancy(np.clip(points, 0, 1)))
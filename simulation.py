@@ -6,60 +6,71 @@ Zejian Huang
 """
 
 import gurobipy as gp
-import math
+import numpy as np
 
 from population import Population
 from model import Model
 from dual import Dual
 from printer import print_solution, print_dual_solution, plot_values
+from store import ResultStore, model_row
+from profiler import Profiler
 
 # parameters
 LAMBDA = 50000  # social value for revenue
 n = 9  # number of types
 q = 1  # ex ante constraint
 v_precision = 4
+backend = "gurobi"  # LP solver, "gurobi" or "highs"
+write_lp = False  # write the model to lp/
+store_path = None  # directory of a ResultStore to append the solved instance to, None for none
+profile = False  # time the stages of the run, see profiler.py
+profile_path = None  # file of the aggregated spans as JSON, or of a cProfile dump if it ends with .prof
+
+profiler = Profiler(profile, cprofile=str(profile_path).endswith(".prof"))
 
 try:
     '''
     Generate population
     '''
-    pop = Population(n)
-
-    '''vm'''
-    pop.vmList = pop.value_uniform(1, 2)
-
-    '''vs'''
-    pop.vsList = pop.value_uniform(2, 9)
-    # pop.vsList = pop.value_kumaraswamy(1.75, 10, 8, 5, 0.75)  # a, b, c, d, q
-    # pop.vsList = pop.value_exponential(scale=1/1)  # scale = 1 / lambda
-    # for i in range(pop.num_type):
-    #     pop.vsList.append(math.log(pop.vmList[i]))
-
-    '''vt'''
-    pop.vtList = pop.value_uniform(2, 1)
-    # for i in range(pop.num_type):
-    #     pop.vtList.append(pop.vsList[i]**2)
-
-    '''add perturbation to values'''
-    # pop.perturbation(-1e-3, 1e-3, precision=v_precision, vs=True, vm=False, vt=False)
-    # for i in range(0, 9):
-    #     if i < 9:
-    #         off = -1 * (i+1) ** 2 / 1000
-    #     else:
-    #         off = 0 * (i+1) ** 2 / 1000
-    #     pop.vsList[i] += off
-    # pop.vsList[7] = (pop.vsList[6]+pop.vsList[8])/2
-    #     pop.vs_perturbation.append(off)
-
-    '''pdf for each type'''
-    pop.type_uniform()
-    # pop.type_kumaraswamy(1.75, 10, 8, 5, 0.75)
-    # pop.pdfList=[.7, .3]
-    # pop.cdfList=[.7, 1]
-
-    pop.calculate_ratio()
-    pop.calculate_virtual_s()
-    pop.calculate_virtual_sm()
+    with profiler.span("generate"):
+        pop = Population(n)
+
+        '''vm'''
+        pop.vmList = pop.value_uniform(1, 2)
+
+        '''vs'''
+        pop.vsList = pop.value_uniform(2, 9)
+        # pop.vsList = pop.value_kumaraswamy(1.75, 10, 8, 5, 0.75)  # a, b, c, d, q
+        # pop.vsList = pop.value_exponential(scale=1/1)  # scale = 1 / lambda
+        # pop.vsList = np.log(pop.vmList)
+
+        '''vt'''
+        pop.vtList = pop.value_uniform(2, 1)
+        # pop.vtList = pop.vsList**2
+
+        '''add perturbation to values'''
+        # pop.perturbation(-1e-3, 1e-3, precision=v_precision, vs=True, vm=False, vt=False)
+        # for i in range(0, 9):
+        #     if i < 9:
+        #         off = -1 * (i+1) ** 2 / 1000
+        #     else:
+        #         off = 0 * (i+1) ** 2 / 1000
+        #     pop.vsList[i] += off
+        # pop.vsList[7] = (pop.vsList[6]+pop.vsList[8])/2
+        #     pop.vs_perturbation.append(off)
+
+        '''pdf for each type'''
+        pop.type_uniform()
+        # pop.type_kumaraswamy(1.75, 10, 8, 5, 0.75)
+        # pop.pdfList=[.7, .3]
+        # pop.cdfList=[.7, 1]
+
+    with profiler.span("calculate"):
+        pop.calculate_ratio()
+        pop.calculate_virtual_s()
+        pop.calculate_virtual_sm()
+        pop.calculate_virtual_st()
+        pop.calculate_rec_hr_st()
 
     '''
     Draw value graphs
@@ -69,16 +80,21 @@ try:
     '''
     Build model
     '''
-    m = Model(pop, q, LAMBDA).m
+    with profiler.span("build"):
+        model = Model(pop, q, LAMBDA, backend=backend)
+        m = model.m
 
     # write model to file
-    m.write("lp/model.lp")
+    if write_lp:
+        m.write("lp/model.lp")
 
     '''
     Solve LP
     '''
     # optimize model
-    m.optimize()
+    with profiler.span("optimize"):
+        m.optimize()
+    profiler.solver("primal", m)
     # m.display()
 
     # handle unbounded and infeasible problems
@@ -87,23 +103,42 @@ try:
         exit(1)
     elif m.status == 3:
         print("infeasible primal")
-        m.computeIIS()
-        m.write("lp/model.ilp")
+        try:
+            m.computeIIS()
+            m.write("lp/model.ilp")
+        except NotImplementedError as e:
+            print(e)
         exit(1)
 
     '''
     Print result
     '''
-    # solution
-    print_solution(m, pop, q, v_precision)
+    # solution, with the dual solution read from the primal
+    with profiler.span("solution"):
+        solution = model.solution()
+    with profiler.span("print"):
+        print_solution(solution, pop, q, v_precision)
+    # print_dual_solution(solution, pop, q, v_precision)
 
     """
-    Dual model
+    Dual solution of the explicit dual model
     """
-    d = Dual(pop, q, LAMBDA).m
-    d.write("lp/dual.lp")
-    d.optimize()
-    # print_dual_solution(d, pop, q, v_precision)
+    # d = Dual(pop, q, LAMBDA, backend=backend)
+    # d.m.write("lp/dual.lp")
+    # d.m.optimize()
+    # print_dual_solution(d.solution(), pop, q, v_precision)
+
+    '''
+    Store result
+    '''
+    if store_path is not None:
+        with profiler.span("store"), ResultStore(store_path) as store:
+            store.append(**model_row(model, q))
+
+    '''
+    Profile
+    '''
+    profiler.report(profile_path)
 
 except gp.GurobiError as e:
     print('GurobiError: ' + e.message)
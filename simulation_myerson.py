@@ -7,84 +7,138 @@ Zejian Huang
 
 import gurobipy as gp
 from population import Population
-from myerson import Myerson
+from myerson import Myerson, closed_form
 from printer import print_solution, print_dual_solution
+from store import ResultStore, myerson_row
+from profiler import Profiler
 
 # parameters
 n = 10   # number of types
 q = 1  # ex ante constraint
 LAMBDA = 0
 v_precision = 4
+explicit_dual = False  # build and solve the dual LP, instead of reading dual values from the primal
+backend = "gurobi"  # LP solver, "gurobi" or "highs"
+use_lp = True  # also solve the LP, as a cross-check of the closed form
+write_lp = False  # write the models to lp/
+store_path = None  # directory of a ResultStore to append the solution to, None for none
+profile = False  # time the stages of the run, see profiler.py
+profile_path = None  # file of the aggregated spans as JSON, or of a cProfile dump if it ends with .prof
+
+profiler = Profiler(profile, cprofile=str(profile_path).endswith(".prof"))
 
 try:
     '''
     Generate population
     '''
-    pop = Population(n)
-    pop.vsList = pop.value_uniform(0, 1)
-    # pop.draw_s_uniform(0, 1, 2)
-
-    # pop.type_uniform()
-    pop.type_kumaraswamy(1.75, 10, 8, 5, 0.75)
-
-    pop.calculate_virtual_s()
+    with profiler.span("generate"):
+        pop = Population(n)
+        pop.vsList = pop.value_uniform(0, 1)
+        # pop.draw_s_uniform(0, 1, 2)
 
+        # pop.type_uniform()
+        pop.type_kumaraswamy(1.75, 10, 8, 5, 0.75)
 
-    '''
-    Build LP model (primal and dual)
-    '''
-    model = Myerson(pop, q, LAMBDA, rev_max=False)
-
-    primal = model.primal
-    dual = model.dual
+    with profiler.span("calculate"):
+        pop.calculate_virtual_s()
 
-    # write model to file
-    primal.write("lp/myerson_primal.lp")
-    dual.write("lp/myerson_dual.lp")
 
     '''
-    Solve primal LP
+    Solve in closed form
     '''
-    # optimize model
-    primal.optimize()
-
-    # handle unbounded and infeasible problems
-    if primal.status == 5:
-        print("unbounded primal")
-        exit(1)
-    elif primal.status == 3:
-        print("infeasible primal")
-        primal.computeIIS()
-        primal.write("lp/model.ilp")
-        exit(1)
+    with profiler.span("closed_form"):
+        solution = closed_form(pop, q, LAMBDA)
+    with profiler.span("print"):
+        print_solution(solution.solution(), pop, q, v_precision, myerson=True)
+    if store_path is not None:
+        with profiler.span("store"), ResultStore(store_path) as store:
+            store.append(**myerson_row(pop, q, LAMBDA, solution))
 
     '''
-    Print result
+    Cross-check with the LP
     '''
-    # solution
-    print_solution(primal, pop, q, v_precision, myerson=True)
-
-    """
-    Solve dual LP
-    """
-    # optimize model
-    dual.optimize()
-
-    # handle unbounded and infeasible problems
-    if dual.status == 5:
-        print("unbounded dual")
-        exit(1)
-    elif dual.status == 3:
-        print("infeasible dual")
-        dual.computeIIS()
-        dual.write("lp/dual.ilp")
-        exit(1)
+    if use_lp:
+        '''
+        Build LP model (primal, dual on demand)
+        '''
+        with profiler.span("build"):
+            model = Myerson(pop, q, LAMBDA, rev_max=False, backend=backend)
+
+        primal = model.primal
+
+        # write model to file
+        if write_lp:
+            primal.write("lp/myerson_primal.lp")
+
+        '''
+        Solve primal LP
+        '''
+        # optimize model
+        with profiler.span("optimize"):
+            primal.optimize()
+        profiler.solver("primal", primal)
+
+        # handle unbounded and infeasible problems
+        if primal.status == 5:
+            print("unbounded primal")
+            exit(1)
+        elif primal.status == 3:
+            print("infeasible primal")
+            try:
+                primal.computeIIS()
+                primal.write("lp/model.ilp")
+            except NotImplementedError as e:
+                print(e)
+            exit(1)
+
+        '''
+        Print result
+        '''
+        # solution
+        with profiler.span("print"):
+            print_solution(model.solution(), pop, q, v_precision, myerson=True)
+        print("LP - closed form: %g" % (primal.objVal - solution.objVal))
+
+        """
+        Dual solution, read from the primal or from the solved dual LP
+        """
+        if explicit_dual:
+            with profiler.span("build dual"):
+                dual = model.dual
+            if write_lp:
+                dual.write("lp/myerson_dual.lp")
+
+            # optimize model
+            with profiler.span("optimize dual"):
+                dual.optimize()
+            profiler.solver("dual", dual)
+
+            # handle unbounded and infeasible problems
+            if dual.status == 5:
+                print("unbounded dual")
+                exit(1)
+            elif dual.status == 3:
+                print("infeasible dual")
+                try:
+                    dual.computeIIS()
+                    dual.write("lp/dual.ilp")
+                except NotImplementedError as e:
+                    print(e)
+                exit(1)
+        else:
+            with profiler.span("dual"):
+                dual = model.dual_values()
+
+        '''
+        Print result
+        '''
+        # solution
+        # print_dual_solution(model.solution(), pop, q, v_precision, myerson=True)
 
     '''
-    Print result
+    Profile
     '''
-    # solution
-    # print_dual_solution(dual, pop, q, v_precision, myerson=True)
+    profiler.report(profile_path)
 
 except gp.GurobiError as e:
     print('GurobiError: ' + e.message)
@@ -0,0 +1,105 @@
+"""
+Module for the solution of a solved model as NumPy arrays
+A Solution holds the primal values, the slacks of the IC, IR and supply constraints, the dual values and
+the masks of the tight constraints, each read from the LP with one bulk call per attribute (see
+Model.solution, Myerson.solution and Dual.solution), so that printers and counterexample checks index
+arrays instead of looking up variables by name. The tight sets of a solution, and optionally its nonzero dual
+sets, pack into a fingerprint of a few bytes, to count the patterns of many solutions, see patterns.py.
+The dual values of a degenerate LP are not unique: which of them the solver returns depends on the basis it
+ends in, i.e. on the solve path (a fresh solve, a warm start from another instance, the Dual model), so the
+nonzero dual sets describe a solve rather than an instance, and are left out of fingerprints by default.
+
+Zejian Huang
+"""
+
+import numpy as np
+from gurobipy import GRB
+
+from builder import ic_pairs
+
+
+class Solution:
+    """
+    :param objVal: objective value
+    :param x: allocations, None if unknown (e.g. a solved Dual model)
+    :param p: payments, None if unknown
+    :param w: waiting times, None if unknown or in Myerson's environment
+    :param slack_ic: n * n array, slack_ic[i, j] is the slack of IC(i, j), nan for pairs not in the model
+    :param slack_ir: slacks of IR
+    :param slack_supply: slack of the supply constraint
+    :param dual: a DualSolution, None if unknown (e.g. the closed form)
+    :param tol: constraints with |slack| <= tol are tight, dual values with |value| <= tol are zero
+    :param status: status of the LP, with the codes of GRB.Status
+    """
+    def __init__(self, objVal, x=None, p=None, w=None, slack_ic=None, slack_ir=None, slack_supply=None, dual=None,
+                 tol=1e-9, status=GRB.OPTIMAL):
+        self.objVal = objVal
+        self.x = x
+        self.p = p
+        self.w = w
+        self.slack_ic = slack_ic
+        self.slack_ir = slack_ir
+        self.slack_supply = slack_supply
+        self.dual = dual
+        self.tol = tol
+        self.status = status
+        # tight primal constraints
+        if slack_ic is not None:
+            with np.errstate(invalid="ignore"):
+                self.tight_ic = np.abs(slack_ic) <= tol
+            self.tight_ir = np.abs(slack_ir) <= tol
+            self.tight_supply = bool(abs(slack_supply) <= tol)
+        # tight dual constraints, one per primal variable x, p (and w), and zero dual values
+        if dual is not None:
+            self.tight_dual = np.abs(dual.slack) <= tol
+            self.zero_ic = np.abs(dual.ic) <= tol
+            self.zero_ir = np.abs(dual.ir) <= tol
+
+    """
+    Fingerprint of the tight sets: the bits of the tight IC (in the order of builder.ic_pairs), tight IR and
+    tight supply constraints, packed into bytes
+    :param duals: also the bits of the nonzero dual IC and IR values, which depend on the solve path
+    """
+    def fingerprint(self, duals=False):
+        I, J = ic_pairs(len(self.tight_ir))
+        bits = [self.tight_ic[I, J], self.tight_ir, [self.tight_supply]]
+        if duals:
+            bits += [~self.zero_ic[I, J], ~self.zero_ir]
+        return np.packbits(np.concatenate(bits)).tobytes()
+
+
+"""
+Masks of a fingerprint of a solution with n types, see Solution.fingerprint
+:param duals: the fingerprint has the nonzero dual bits
+:return: dict of tight_ic (n * n), tight_ir, tight_supply, and with duals nonzero_ic (n * n), nonzero_ir
+"""
+def unpack_fingerprint(fingerprint, n, duals=False):
+    I, J = ic_pairs(n)
+    k = len(I)
+    count = 2 * k + 2 * n + 1 if duals else k + n + 1
+    bits = np.unpackbits(np.frombuffer(fingerprint, dtype=np.uint8), count=count).astype(bool)
+    tight_ic = np.zeros((n, n), dtype=bool)
+    tight_ic[I, J] = bits[:k]
+    masks = {"tight_ic": tight_ic, "tight_ir": bits[k:k + n], "tight_supply": bool(bits[k + n])}
+    if duals:
+        nonzero_ic = np.zeros((n, n), dtype=bool)
+        nonzero_ic[I, J] = bits[k + n + 1:2 * k + n + 1]
+        masks.update(nonzero_ic=nonzero_ic, nonzero_ir=bits[2 * k + n + 1:])
+    return masks
+
+
+"""
+Solution of a solved primal LP from its X and Slack vectors
+:param values: X of the LP, split into x, p (and w)
+:param slack: Slack of the LP
+:param I, J, rows: IC pairs in the model and their rows
+:param num_ic: number of IC rows before the IR rows, followed by the supply row
+:param dual: a DualSolution of the primal
+"""
+def primal_solution(objVal, values, slack, I, J, rows, num_ic, dual=None, tol=1e-9, myerson=False):
+    n = len(values) // (2 if myerson else 3)
+    slack_ic = np.full((n, n), np.nan)
+    slack_ic[I, J] = slack[rows]
+    parts = np.split(values, 2 if myerson else 3)
+    w = None if myerson else parts[2]
+    return Solution(objVal, parts[0], parts[1], w, slack_ic, slack[num_ic:num_ic + n], slack[num_ic + n], dual, tol)
@@ -0,0 +1,168 @@
+"""
+Module for a content-addressed on-disk cache of solved instances
+An instance is keyed by a hash of the population arrays, q, LAMBDA, the model (Model, Dual or Myerson and
+its options), the LP backend and the solver parameters, so that a change of method or tolerance does not
+read solutions of other settings. An entry holds the status, objective, primal values, dual values and
+slacks of the solved LP in one .npz file, written under a temporary name and renamed, so that several
+processes can share a cache directory: a reader sees a whole entry or none, and an entry solved twice at
+the same time is written twice with the same content. When the entries exceed max_bytes, the least
+recently used ones are removed.
+
+Zejian Huang
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from gurobipy import GRB
+
+from model import Model
+from dual import Dual
+from myerson import Myerson
+
+MODELS = {"model": Model, "dual": Dual, "myerson": Myerson}
+# population arrays an instance depends on
+ARRAYS = ("vs", "vm", "vt", "pdf", "cdf")
+
+
+class SolveCache:
+    """
+    Open a cache, creating its directory if needed
+    :param path: directory of the cache
+    :param max_bytes: size bound of the entries; each process checks it after its own writes, so the
+        directory may exceed it by the entries other processes wrote since their last check
+    """
+    def __init__(self, path, max_bytes=2 ** 30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.entries())
+
+    """
+    Key of an instance, a hex digest
+    :param model: "model", "dual" or "myerson"
+    :param params: solver parameters, see set_params of backend.py, e.g. {"method": "dual", "OptimalityTol": 1e-9},
+        None for the defaults
+    :param options: options of the model, e.g. lazy_ic=True
+    """
+    def key(self, model, pop, q, LAMBDA, backend="gurobi", params=None, **options):
+        h = hashlib.sha256()
+        h.update(repr((model, backend, sorted((params or {}).items()), sorted(options.items()), float(q),
+                       float(LAMBDA), pop.num_type)).encode())
+        for name in ARRAYS:
+            values = np.ascontiguousarray(getattr(pop, name), dtype=np.float64)
+            h.update(name.encode() + len(values).to_bytes(8, "little") + values.tobytes())
+        return h.hexdigest()
+
+    def file(self, key):
+        return os.path.join(self.path, key + ".npz")
+
+    """
+    Entry of a key, None if not cached
+    :return: dict of arrays
+    """
+    def get(self, key):
+        try:
+            with np.load(self.file(key)) as data:
+                entry = {name: data[name] for name in data.files}
+            # the modification time orders the entries for eviction
+            os.utime(self.file(key))
+        except (OSError, ValueError):
+            # not cached, or removed by another process meanwhile
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    """
+    Write the entry of a key, then remove the least recently used entries if the cache is too large
+    """
+    def put(self, key, entry):
+        temp = self.file(key) + "." + str(os.getpid()) + ".tmp"
+        with open(temp, "wb") as file:
+            np.savez(file, **entry)
+        self.size += os.path.getsize(temp)
+        os.replace(temp, self.file(key))
+        if self.size > self.max_bytes:
+            self.evict()
+
+    """
+    Remove the least recently used entries until the cache holds at most 90% of max_bytes
+    """
+    def evict(self):
+        entries = sorted(self.entries(), key=lambda e: e[2])
+        self.size = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self.size <= 0.9 * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+
+    """
+    Entries in the directory
+    :return: list of (path, bytes, modification time)
+    """
+    def entries(self):
+        found = []
+        for e in os.scandir(self.path):
+            if e.name.endswith(".npz"):
+                try:
+                    stat = e.stat()
+                except FileNotFoundError:
+                    continue
+                found.append((e.path, stat.st_size, stat.st_mtime))
+        return found
+
+    """
+    Entry of an instance, solved and cached if not cached yet
+    :param model: "model", "dual" or "myerson"
+    :param params: solver parameters, set on the LP before solving, see key
+    :param options: options of the model, e.g. lazy_ic=True
+    :return: dict of arrays, see entry
+    """
+    def solve(self, model, pop, q, LAMBDA, backend="gurobi", params=None, **options):
+        key = self.key(model, pop, q, LAMBDA, backend, params, **options)
+        result = self.get(key)
+        if result is None:
+            solved = MODELS[model](pop, q, LAMBDA, backend=backend, **options)
+            if params:
+                (solved.primal if isinstance(solved, Myerson) else solved.m).set_params(params)
+            if model == "dual":
+                solved.m.optimize()
+            else:
+                solved.optimize()
+            result = entry(solved)
+            self.put(key, result)
+        return result
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self.size = 0
+
+
+"""
+Entry of a solved Model, Dual or Myerson: status, and if optimal obj and the X, RC, Pi, Slack vectors of its
+(primal) LP, with the dual values dual_ic (n * n), dual_ir, dual_bound, dual_supply of a Model or Myerson
+"""
+def entry(solved):
+    lp = solved.primal if isinstance(solved, Myerson) else solved.m
+    result = {"status": np.array(lp.status)}
+    if lp.status != GRB.OPTIMAL:
+        return result
+    result["obj"] = np.array(lp.ObjVal)
+    for attr in ("X", "RC", "Pi", "Slack"):
+        result[attr] = lp.get(attr)
+    if not isinstance(solved, Dual):
+        d = solved.dual_values()
+        result.update(dual_ic=d.ic, dual_ir=d.ir, dual_bound=d.bound, dual_supply=np.array(d.supply))
+    return result
@@ -0,0 +1,189 @@
+"""
+Module for a columnar on-disk store of solved instances
+Rows, one per solved instance, are buffered in memory and flushed in chunks. A chunk is a directory with
+one .npy file per column (the members of an uncompressed .npz), so a column of a large run is read by
+memory-mapping its chunks instead of parsing printed tables. With pyarrow installed, chunks can also be
+written as Parquet files. One writer per store directory.
+
+Zejian Huang
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from builder import ic_pairs
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class ResultStore:
+    """
+    Open a store for appending, creating its directory if needed
+    :param path: directory of the store
+    :param chunk: number of buffered rows written per chunk
+    :param format: "npy" (a directory of .npy files per chunk) or "parquet"
+    """
+    def __init__(self, path, chunk=10000, format="npy"):
+        if format == "parquet" and pa is None:
+            raise ImportError("the parquet format requires pyarrow")
+        if format not in ("npy", "parquet"):
+            raise ValueError("unknown store format: " + str(format))
+        self.path = path
+        self.chunk = chunk
+        self.format = format
+        self.rows = {}
+        self.num_rows = 0
+        os.makedirs(path, exist_ok=True)
+        self.num_chunks = len(chunks(path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    Buffer one row, given as column=value with scalar or 1-D array values, and flush when the buffer is full
+    """
+    def append(self, **row):
+        if self.rows and row.keys() != self.rows.keys():
+            raise ValueError("columns differ from the buffered rows: " + ", ".join(sorted(row)))
+        for name, value in row.items():
+            self.rows.setdefault(name, []).append(np.asarray(value))
+        self.num_rows += 1
+        if self.num_rows >= self.chunk:
+            self.flush()
+
+    """
+    Buffer several rows, given as a dict of columns with one row per entry of the first axis, e.g. a sweep result
+    """
+    def extend(self, columns):
+        columns = {name: np.asarray(value) for name, value in columns.items()}
+        for k in range(len(next(iter(columns.values())))):
+            self.append(**{name: value[k] for name, value in columns.items()})
+
+    """
+    Write the buffered rows as a new chunk
+    The chunk is written under a unique temporary name and renamed, so readers never see a partial chunk, and
+    the temporary files of a run killed during a flush do not block later flushes.
+    """
+    def flush(self):
+        if self.num_rows == 0:
+            return
+        columns = {name: np.stack(values) for name, values in self.rows.items()}
+        name = os.path.join(self.path, "chunk_%06d" % self.num_chunks)
+        prefix = os.path.basename(name) + "."
+        if self.format == "npy":
+            temp = tempfile.mkdtemp(prefix=prefix, suffix=".tmp", dir=self.path)
+            for column, values in columns.items():
+                np.save(os.path.join(temp, column + ".npy"), values)
+            os.rename(temp, name)
+        else:
+            fd, temp = tempfile.mkstemp(prefix=prefix, suffix=".parquet.tmp", dir=self.path)
+            os.close(fd)
+            pq.write_table(to_table(columns), temp)
+            os.replace(temp, name + ".parquet")
+        self.num_chunks += 1
+        self.rows = {}
+        self.num_rows = 0
+
+    def close(self):
+        self.flush()
+
+
+"""
+Arrow table of a dict of columns, rows of 1-D arrays as fixed size lists
+"""
+def to_table(columns):
+    arrays = {}
+    for name, values in columns.items():
+        if values.ndim == 1:
+            arrays[name] = pa.array(values)
+        else:
+            arrays[name] = pa.FixedSizeListArray.from_arrays(pa.array(values.reshape(-1)), values.shape[1])
+    return pa.table(arrays)
+
+
+"""
+Chunks of a store and of the stores in its subdirectories (e.g. one per worker), in name order
+"""
+def chunks(path):
+    found = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        found += [os.path.join(root, d) for d in dirs if d.startswith("chunk_") and not d.endswith(".tmp")]
+        found += [os.path.join(root, f) for f in files if f.startswith("chunk_") and f.endswith(".parquet")]
+    return sorted(found)
+
+
+"""
+Read a column of a chunk, memory-mapped if the chunk is a directory of .npy files
+"""
+def read_chunk(chunk, column, mmap=True):
+    if chunk.endswith(".parquet"):
+        if pq is None:
+            raise ImportError("reading parquet chunks requires pyarrow")
+        values = pq.read_table(chunk, columns=[column]).column(0).combine_chunks()
+        if pa.types.is_fixed_size_list(values.type):
+            return values.flatten().to_numpy(zero_copy_only=False).reshape(len(values), values.type.list_size)
+        return values.to_numpy(zero_copy_only=False)
+    return np.load(os.path.join(chunk, column + ".npy"), mmap_mode="r" if mmap else None)
+
+
+"""
+Iterate over a column of a store chunk by chunk, without loading the other columns or chunks
+"""
+def scan(path, column, mmap=True):
+    for chunk in chunks(path):
+        yield read_chunk(chunk, column, mmap)
+
+
+"""
+Load columns of a store
+:param columns: names of the columns, all columns if None
+:return: dict of columns, the chunks concatenated
+"""
+def load(path, columns=None):
+    found = chunks(path)
+    if not found:
+        return {}
+    if columns is None:
+        if found[0].endswith(".parquet"):
+            columns = pq.read_schema(found[0]).names
+        else:
+            columns = sorted(f[:-4] for f in os.listdir(found[0]) if f.endswith(".npy"))
+    return {column: np.concatenate(list(scan(path, column))) for column in columns}
+
+
+"""
+Row of a solved Model: population, parameters, objective, solution, duals and tight constraints, from
+Model.solution
+IC constraints are in the order of builder.ic_pairs, those not in the model (local and lazy modes) not tight.
+:param tol: constraints with |slack| <= tol are tight
+"""
+def model_row(model, q, tol=1e-9):
+    pop = model.pop
+    s = model.solution(tol)
+    I, J = ic_pairs(pop.num_type)
+    return {"q": q, "LAMBDA": model.LAMBDA, "vs": pop.vs, "vm": pop.vm, "vt": pop.vt, "pdf": pop.pdf,
+            "status": model.m.status, "obj": s.objVal, "x": s.x, "p": s.p, "w": s.w,
+            "dual_ic": s.dual.ic[I, J], "dual_ir": s.dual.ir, "dual_bound": s.dual.bound, "dual_supply": s.dual.supply,
+            "tight": np.concatenate([s.tight_ic[I, J], s.tight_ir, [s.tight_supply]])}
+
+
+"""
+Row of a solved primal in the Myerson environment, from the LP or from myerson.closed_form
+:param solution: the solved primal or a MyersonSolution
+:param tol: constraints with |slack| <= tol are tight
+"""
+def myerson_row(pop, q, LAMBDA, solution, tol=1e-9):
+    x, p = np.split(np.array([v.x for v in solution.getVars()]), 2)
+    return {"q": q, "LAMBDA": LAMBDA, "vs": pop.vs, "pdf": pop.pdf, "obj": solution.objVal, "x": x, "p": p,
+            "tight": np.abs(np.asarray(solution.getAttr("slack"))) <= tol}
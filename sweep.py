@@ -0,0 +1,254 @@
+"""
+Parametric sweep over the ex ante constraint q and the social value for revenue LAMBDA
+The model is built once; each grid point only updates the supply right-hand side (q) or the
+objective coefficients of p (LAMBDA) in place and re-optimizes from the previous basis.
+With a SolveCache, cached grid points are read from it, and the model is only built for the others.
+With ranging, each LAMBDA is instead swept over q parametrically (see sweep_q): the right-hand side ranging of
+the supply row gives the interval of q over which the current basis stays optimal, the grid points in it are
+filled analytically, and the model is only re-solved past the end of the interval. This also gives the exact
+piecewise-linear value curve over q and its breakpoints.
+
+Zejian Huang
+"""
+
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from gurobipy import GRB
+
+from builder import ic_pairs, primal_matrices
+from model import Model
+from solve_cache import entry
+
+
+"""
+Columns of a sweep result with no grid point solved yet
+"""
+def empty_result(qs, lambdas, n):
+    rows = len(qs) * len(lambdas)
+    return {
+        "q": np.tile(qs, len(lambdas)),
+        "LAMBDA": np.repeat(lambdas, len(qs)),
+        "status": np.zeros(rows, dtype=int),
+        "obj": np.full(rows, np.nan),
+        "x": np.full((rows, n), np.nan),
+        "p": np.full((rows, n), np.nan),
+        "w": np.full((rows, n), np.nan),
+        # IC, IR and supply rows
+        "tight": np.zeros((rows, len(ic_pairs(n)[0]) + n + 1), dtype=bool),
+    }
+
+
+"""
+Solve the model at every grid point (q, LAMBDA)
+The grid is traversed LAMBDA by LAMBDA, q back and forth, so that consecutive points differ in one parameter:
+a change of q keeps the basis dual feasible (dual simplex), a change of LAMBDA keeps it primal feasible (primal simplex).
+:param pop: a population instance
+:param qs: grid of ex ante constraints
+:param lambdas: grid of social values for revenue
+:param tol: constraints with |slack| <= tol are tight
+:param backend: LP solver, "gurobi" or "highs", see backend.py
+:param cache: a SolveCache of the grid points, None for none
+:param ranging: sweep q by right-hand side ranging, see sweep_q, without a cache
+:return: dict of columns, one row per grid point in the order (LAMBDA, q):
+    q, LAMBDA, status, obj, x, p, w (num_points * n), tight (num_points * num_constraints),
+    and with ranging curves, the value curve over q of each LAMBDA, see sweep_q
+"""
+def sweep(pop, qs, lambdas, tol=1e-9, backend="gurobi", cache=None, ranging=False):
+    qs = np.asarray(qs, dtype=np.float64)
+    lambdas = np.asarray(lambdas, dtype=np.float64)
+    n = pop.num_type
+    model = None
+    result = empty_result(qs, lambdas, n)
+    if ranging:
+        if cache is not None:
+            raise ValueError("a ranging sweep does not use a cache")
+        result["curves"] = []
+        for a, LAMBDA in enumerate(lambdas):
+            columns, curve, model = sweep_q(pop, qs, LAMBDA, tol, backend, model)
+            for name in ("status", "obj", "x", "p", "w", "tight"):
+                result[name][a * len(qs):(a + 1) * len(qs)] = columns[name]
+            result["curves"].append(curve)
+        return result
+
+    for a, LAMBDA in enumerate(lambdas):
+        order = range(len(qs)) if a % 2 == 0 else reversed(range(len(qs)))
+        for b in order:
+            key = None if cache is None else cache.key("model", pop, qs[b], LAMBDA, backend)
+            solved = None if cache is None else cache.get(key)
+            if solved is None:
+                if model is None:
+                    model = Model(pop, qs[b], LAMBDA, backend=backend)
+                    method = "primal"
+                elif model.LAMBDA != LAMBDA:
+                    model.set_lambda(LAMBDA)
+                    method = "primal"
+                model.set_q(qs[b])
+                model.m.optimize(method)
+                method = "dual"
+                solved = entry(model)
+                if cache is not None:
+                    cache.put(key, solved)
+            row = a * len(qs) + b
+            result["status"][row] = solved["status"]
+            if solved["status"] != GRB.OPTIMAL:
+                continue
+            result["obj"][row] = solved["obj"]
+            result["x"][row], result["p"][row], result["w"][row] = np.split(solved["X"], 3)
+            result["tight"][row] = np.abs(solved["Slack"]) <= tol
+    return result
+
+
+class Piece:
+    """
+    Interval [lo, up] of q over which a basis stays optimal, with the solution at q0 in it and its derivatives
+    in q: the objective, values X and slacks are linear in q over the interval
+    """
+    def __init__(self, lo, up, q0, obj, slope, X, dX, slack, dslack):
+        self.lo = lo
+        self.up = up
+        self.q0 = q0
+        self.obj = obj
+        self.slope = slope
+        self.X = X
+        self.dX = dX
+        self.slack = slack
+        self.dslack = dslack
+
+    def value(self, q):
+        return self.obj + self.slope * (q - self.q0)
+
+
+"""
+Solve the model at q and read the interval of its basis from the ranging of the supply row
+The derivative of the basic variables solves the tight rows of the basis for a unit change of the supply
+right-hand side, the nonbasic variables staying at their bounds.
+:param A: constraint matrix of the model, see builder.primal_matrices
+:return: the Piece of the basis, None if the LP is not optimal at q
+"""
+def solve_piece(model, A, q, method="dual"):
+    m = model.m
+    model.set_q(q)
+    m.optimize(method)
+    if m.status != GRB.OPTIMAL:
+        return None
+    supply = model.supply
+    unit = np.zeros(A.shape[0])
+    unit[supply] = 1
+    basic = m.get("VBasis") == 0
+    tight = m.get("CBasis") != 0
+    dX = np.zeros(A.shape[1])
+    if basic.any():
+        B = sp.csc_matrix(A[tight][:, basic])
+        if B.shape[0] == B.shape[1]:
+            dX[basic] = spla.spsolve(B, unit[tight])
+        else:
+            dX[basic] = spla.lsqr(B, unit[tight], atol=1e-14, btol=1e-14)[0]
+    lo = min(float(m.get("SARHSLow")[supply]), q)
+    up = max(float(m.get("SARHSUp")[supply]), q)
+    return Piece(lo, up, q, m.ObjVal, float(m.get("Pi")[supply]), m.get("X"), dX, m.get("Slack"), unit - A @ dX)
+
+
+"""
+Parametric sweep over q at a fixed LAMBDA by right-hand side ranging
+Starting from the smallest q of the grid, each solve gives the interval of q over which its basis stays optimal,
+and the next solve is at the first grid point past the interval. If the basis found there does not start where
+the previous one ends, the bases in between are found by solving at the middle of the gap, so that the intervals
+cover the grid range without gaps and the value curve is exact. Grid points are filled from the basis of their
+interval, in O(1) solves per basis instead of one solve per grid point.
+:param pop: a population instance
+:param qs: grid of ex ante constraints, all feasible (q >= 0)
+:param LAMBDA: social value for revenue
+:param tol: constraints with |slack| <= tol are tight, and intervals closer than tol (in q) are adjacent
+:param backend: LP solver, "gurobi" or "highs", see backend.py
+:param model: a Model of the population to re-optimize from its basis, built if None
+:param max_solves: bound of the number of solves, against numerical cycling
+:return: columns of sweep for the grid points, in the order of qs, the value curve, and the model. The curve is
+    a dict of breakpoints q and obj, the value at each breakpoint including both ends of the grid, slope,
+    the slope of the value between consecutive breakpoints, bases, the interval of each basis, and solves,
+    the number of solves
+"""
+def sweep_q(pop, qs, LAMBDA, tol=1e-9, backend="gurobi", model=None, max_solves=None):
+    qs = np.asarray(qs, dtype=np.float64)
+    grid = np.unique(qs)
+    if max_solves is None:
+        max_solves = 4 * len(grid) + 100
+    method = "dual"
+    if model is None:
+        model = Model(pop, grid[0], LAMBDA, backend=backend)
+        method = "primal"
+    elif model.LAMBDA != LAMBDA:
+        model.set_lambda(LAMBDA)
+        method = "primal"
+    A = primal_matrices(pop, grid[0], LAMBDA)[1]
+
+    # chain of bases from the smallest q of the grid, and bases found past the end of the chain
+    chain = []
+    found = []
+    frontier = grid[0]
+    probe = grid[0]
+    solves = 0
+    while True:
+        if solves >= max_solves:
+            raise RuntimeError("no exact value curve after %d solves" % solves)
+        piece = solve_piece(model, A, probe, method)
+        method = "dual"
+        solves += 1
+        if piece is None:
+            raise ValueError("the model is not optimal at q = %g, use sweep for this grid" % probe)
+        found.append(piece)
+        # extend the chain with the bases starting at its end, skipping bases that end there (degenerate)
+        while frontier < grid[-1] - tol:
+            following = [p for p in found if p.lo <= frontier + tol and p.up > frontier + tol]
+            if not following:
+                break
+            chain.append(max(following, key=lambda p: p.up))
+            frontier = chain[-1].up
+        if frontier >= grid[-1] - tol:
+            if not chain:
+                # a grid of a single point
+                chain.append(piece)
+            break
+        # next probe: the first grid point past the chain, or the middle of the gap to a basis found past it
+        later = min([p.lo for p in found if p.lo > frontier + tol], default=np.inf)
+        probe = grid[np.searchsorted(grid, frontier + tol, side="right")]
+        if later <= probe:
+            probe = (frontier + later) / 2
+
+    columns = fill(chain, qs, pop.num_type, tol)
+    return columns, curve(chain, grid[0], grid[-1], solves, tol), model
+
+
+"""
+Columns of sweep at the grid points from the bases of their intervals
+"""
+def fill(chain, qs, n, tol):
+    columns = empty_result(qs, [0], n)
+    ups = np.array([p.up for p in chain])
+    for row, q in enumerate(qs):
+        piece = chain[min(np.searchsorted(ups, q - tol), len(chain) - 1)]
+        X = piece.X + piece.dX * (q - piece.q0)
+        columns["status"][row] = GRB.OPTIMAL
+        columns["obj"][row] = piece.value(q)
+        columns["x"][row], columns["p"][row], columns["w"][row] = np.split(X, 3)
+        columns["tight"][row] = np.abs(piece.slack + piece.dslack * (q - piece.q0)) <= tol
+    return columns
+
+
+"""
+Value curve over [start, end] from the chain of bases, merging consecutive bases with the same slope
+"""
+def curve(chain, start, end, solves, tol):
+    breakpoints = [start]
+    slopes = [chain[0].slope]
+    for previous, piece in zip(chain, chain[1:]):
+        if abs(piece.slope - slopes[-1]) > tol * max(1.0, abs(piece.slope)):
+            # the bases of different slopes meet at a single q, where the previous interval ends
+            breakpoints.append(previous.up)
+            slopes.append(piece.slope)
+    breakpoints.append(end)
+    breakpoints = np.array(breakpoints)
+    ups = np.array([p.up for p in chain])
+    obj = np.array([chain[min(np.searchsorted(ups, q - tol), len(chain) - 1)].value(q) for q in breakpoints])
+    bases = np.array([[max(p.lo, start), min(p.up, end)] for p in chain])
+    return {"q": breakpoints, "obj": obj, "slope": np.array(slopes), "bases": bases, "solves": solves}
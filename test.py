@@ -1,5 +1,6 @@
 from population import Population
 
 p = Population(4)
-p.generate_mt_uniform(1, 2)
-p.generate_s_random(0, 1, 2)
\ No newline at end of file
+p.vmList = p.value_uniform(1, 2)
+p.vtList = p.value_uniform(2, 1)
+p.vsList = p.draw_uniform(0, 1, 2)